@@ -3,10 +3,16 @@ from tkinter import ttk, messagebox, scrolledtext, filedialog
 import cv2
 from PIL import Image, ImageTk
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import deque
 import time
 from datetime import datetime
 import os
 import pickle
+import hashlib
+import json
+import struct
 import numpy as np
 from urllib.request import urlretrieve
 import winsound  # Para Windows
@@ -123,6 +129,2326 @@ class SistemaAlarme:
         self.alarme_ativo = False
 
 
+TAMANHO_COMPARACAO = (100, 100)
+
+
+def preprocessar_face(face, tamanho=TAMANHO_COMPARACAO):
+    """Redimensiona e equaliza uma face para comparação"""
+    face = cv2.resize(face, tamanho)
+    return cv2.equalizeHist(face)
+
+
+def matriz_alinhada(formato, dtype, alinhamento=64):
+    """Aloca uma matriz contígua cujo início respeita o alinhamento (bytes)"""
+    dtype = np.dtype(dtype)
+    tamanho = int(np.prod(formato)) * dtype.itemsize
+    buffer = np.empty(tamanho + alinhamento, dtype=np.uint8)
+    deslocamento = (-buffer.ctypes.data) % alinhamento
+    return buffer[deslocamento:deslocamento + tamanho].view(dtype).reshape(formato)
+
+
+def alinhar(matriz, alinhamento=64):
+    """Retorna a matriz se já estiver alinhada e contígua; senão, uma cópia alinhada"""
+    if matriz is None or not isinstance(matriz, np.ndarray):
+        return matriz
+    if matriz.flags['C_CONTIGUOUS'] and matriz.ctypes.data % alinhamento == 0:
+        return matriz
+    copia = matriz_alinhada(matriz.shape, matriz.dtype, alinhamento)
+    copia[...] = matriz
+    return copia
+
+
+QUANTIZACOES = {'int8': 8, 'int4': 4}
+
+
+def quantizar(matriz, bits):
+    """Quantização simétrica por dimensão em int8 ou 4 bits (dois valores por byte)"""
+    maximo = 2 ** (bits - 1) - 1
+    escala = np.abs(matriz).max(axis=0) / maximo
+    escala[escala == 0] = 1
+    valores = np.clip(np.rint(matriz / escala), -maximo, maximo).astype(np.int8)
+
+    if bits == 4:
+        if valores.shape[1] % 2:
+            valores = np.pad(valores, ((0, 0), (0, 1)))
+        deslocados = (valores + 8).astype(np.uint8)
+        valores = deslocados[:, 0::2] | (deslocados[:, 1::2] << 4)
+
+    quantizada = matriz_alinhada(valores.shape, valores.dtype)
+    quantizada[...] = valores
+    return quantizada, escala.astype(np.float32)
+
+
+def desquantizar(quantizada, escala, bits):
+    """Converte um bloco quantizado de volta para float32"""
+    if bits == 4:
+        valores = np.empty((len(quantizada), quantizada.shape[1] * 2), dtype=np.int8)
+        valores[:, 0::2] = (quantizada & 0x0F).astype(np.int8) - 8
+        valores[:, 1::2] = (quantizada >> 4).astype(np.int8) - 8
+        valores = valores[:, :len(escala)]
+    else:
+        valores = quantizada
+    return valores.astype(np.float32) * escala
+
+
+def _mais_proximos(vetores, centroides, quantidade=1, bytes_bloco=16 * 1024 * 1024):
+    """Índices dos centróides mais próximos (L2) de cada vetor
+
+    Os vetores são convertidos para float32 em blocos de até `bytes_bloco`,
+    então a memória extra não cresce com a galeria nem com a dimensão.
+    """
+    normas = np.einsum('ij,ij->i', centroides, centroides)
+    resultado = np.empty((len(vetores), quantidade), dtype=np.int32)
+    tamanho_bloco = max(1, bytes_bloco // (4 * (centroides.shape[1] + len(centroides))))
+    for inicio in range(0, len(vetores), tamanho_bloco):
+        bloco = np.asarray(vetores[inicio:inicio + tamanho_bloco], dtype=np.float32)
+        distancias = normas - 2 * (bloco @ centroides.T)
+        if quantidade < len(centroides):
+            proximos = np.argpartition(distancias, quantidade - 1, axis=1)[:, :quantidade]
+        else:
+            proximos = np.argsort(distancias, axis=1)
+        resultado[inicio:inicio + len(bloco)] = proximos[:, :quantidade]
+    return resultado
+
+
+def _kmeans(amostra, grupos, iteracoes, rng):
+    """K-means simples (L2); retorna os centróides"""
+    centroides = amostra[rng.choice(len(amostra), grupos, replace=False)].copy()
+    for _ in range(iteracoes):
+        atribuicao = _mais_proximos(amostra, centroides)[:, 0]
+        # Uma ordenação por grupo em vez de uma máscara por grupo: cada grupo é uma fatia
+        # contígua de `ordem`; grupos vazios mantêm o centróide anterior
+        ordem = np.argsort(atribuicao, kind='stable')
+        contagens = np.bincount(atribuicao, minlength=grupos)
+        fins = np.cumsum(contagens)
+        for grupo in np.flatnonzero(contagens):
+            centroides[grupo] = amostra[ordem[fins[grupo] - contagens[grupo]:fins[grupo]]].mean(axis=0)
+    return centroides
+
+
+class IndiceIVF:
+    """Índice aproximado (IVF): agrupa a galeria por k-means e busca só nas listas mais próximas"""
+
+    tipo = 'ivf'
+
+    def __init__(self, listas=0, sondagens=8, iteracoes=10, semente=0):
+        # listas=0 escolhe automaticamente ~sqrt(N)
+        self.listas = listas
+        self.sondagens = sondagens
+        self.iteracoes = iteracoes
+        self.semente = semente
+
+        self.centroides = None
+        self.ordem = None
+        self.inicios = None
+
+    def parametros(self):
+        return {'listas': self.listas, 'sondagens': self.sondagens,
+                'iteracoes': self.iteracoes, 'semente': self.semente}
+
+    def construir(self, vetores, rotulos=None, amostra_maxima=20000, memoria_amostra=64 * 1024 * 1024):
+        """Treina os centróides em uma amostra e distribui toda a galeria nas listas
+
+        A amostra (float32) é limitada também em bytes: com vetores longos
+        (pixels, LBPH) ela tem menos linhas, mas nunca menos que as listas.
+        """
+        rng = np.random.default_rng(self.semente)
+        total = len(vetores)
+        listas = self.listas or int(np.sqrt(total))
+        listas = max(1, min(listas, total))
+
+        por_memoria = memoria_amostra // (4 * max(1, int(np.prod(vetores.shape[1:]))))
+        tamanho_amostra = min(total, max(listas, min(amostra_maxima, por_memoria)))
+        escolhidos = rng.choice(total, tamanho_amostra, replace=False)
+        amostra = np.asarray(vetores[np.sort(escolhidos)], dtype=np.float32)
+        centroides = _kmeans(amostra, listas, self.iteracoes, rng)
+
+        atribuicao = _mais_proximos(vetores, centroides)[:, 0]
+        self.centroides = centroides
+        self.ordem = np.argsort(atribuicao, kind='stable').astype(np.int32)
+        self.inicios = np.searchsorted(atribuicao[self.ordem], np.arange(listas + 1)).astype(np.int64)
+
+    def candidatos(self, vetor, sondagens=None):
+        """Índices da galeria nas listas mais próximas da consulta"""
+        return self.candidatos_lote(vetor[None, :], sondagens)[0]
+
+    def candidatos_lote(self, vetores, sondagens=None):
+        """Candidatos de várias consultas, sondando os centróides de uma só vez"""
+        sondagens = min(sondagens or self.sondagens, len(self.centroides))
+        listas = _mais_proximos(vetores, self.centroides, sondagens)
+        return [np.concatenate([self.ordem[self.inicios[l]:self.inicios[l + 1]] for l in linha]) for linha in listas]
+
+    def arrays(self):
+        return {'centroides': self.centroides, 'ordem': self.ordem, 'inicios': self.inicios}
+
+    def exportar_estado(self):
+        return {'tipo': self.tipo, 'parametros': self.parametros(), 'arrays': self.arrays()}
+
+    @classmethod
+    def de_estado(cls, estado):
+        indice = cls(**estado['parametros'])
+        for nome, valor in estado['arrays'].items():
+            setattr(indice, nome, valor)
+        return indice
+
+
+class IndicePrototipos(IndiceIVF):
+    """Busca em dois estágios: protótipos de cada pessoa e depois só as imagens das melhores pessoas"""
+
+    tipo = 'prototipos'
+
+    def __init__(self, prototipos=3, sondagens=5, iteracoes=5, semente=0):
+        super().__init__(sondagens=sondagens, iteracoes=iteracoes, semente=semente)
+        # Protótipos (centróides k-means) por pessoa; sondagens = pessoas mantidas
+        self.prototipos = prototipos
+        self.donos = None
+        self.normas = None
+
+    def parametros(self):
+        return {'prototipos': self.prototipos, 'sondagens': self.sondagens,
+                'iteracoes': self.iteracoes, 'semente': self.semente}
+
+    def construir(self, vetores, rotulos=None, amostra_maxima=None):
+        """Agrupa as imagens de cada pessoa em poucos protótipos"""
+        rng = np.random.default_rng(self.semente)
+        rotulos = np.asarray(rotulos)
+
+        self.ordem = np.argsort(rotulos, kind='stable').astype(np.int32)
+        pessoas, inicios = np.unique(rotulos[self.ordem], return_index=True)
+        self.inicios = np.append(inicios, len(rotulos)).astype(np.int64)
+
+        centroides = []
+        donos = []
+        for posicao in range(len(pessoas)):
+            indices = self.ordem[self.inicios[posicao]:self.inicios[posicao + 1]]
+            membros = np.asarray(vetores[indices], dtype=np.float32)
+            grupos = min(self.prototipos, len(membros))
+            centroides.append(_kmeans(membros, grupos, self.iteracoes, rng))
+            donos.extend([posicao] * grupos)
+
+        self.centroides = np.concatenate(centroides)
+        self.donos = np.asarray(donos, dtype=np.int32)
+        self.normas = None
+
+    def candidatos_lote(self, vetores, sondagens=None):
+        """Índices das imagens das pessoas cujos protótipos estão mais próximos de cada consulta"""
+        pessoas = len(self.inicios) - 1
+        sondagens = min(sondagens or self.sondagens, pessoas)
+
+        if self.normas is None:
+            self.normas = np.einsum('ij,ij->i', self.centroides, self.centroides)
+        distancias = self.normas[None, :] - 2 * (np.asarray(vetores, dtype=np.float32) @ self.centroides.T)
+        # Os protótipos de cada pessoa são contíguos (donos em ordem crescente)
+        primeiros = np.searchsorted(self.donos, np.arange(pessoas))
+        por_pessoa = np.minimum.reduceat(distancias, primeiros, axis=1)
+
+        melhores = np.argpartition(por_pessoa, sondagens - 1, axis=1)[:, :sondagens]
+        return [np.concatenate([self.ordem[self.inicios[p]:self.inicios[p + 1]] for p in linha]) for linha in melhores]
+
+    def arrays(self):
+        return {'centroides': self.centroides, 'donos': self.donos,
+                'ordem': self.ordem, 'inicios': self.inicios}
+
+
+INDICES_BUSCA = {indice.tipo: indice for indice in (IndiceIVF, IndicePrototipos)}
+
+
+def indice_de_estado(estado):
+    """Reconstrói um índice de busca a partir do estado salvo"""
+    return INDICES_BUSCA[estado.get('tipo', IndiceIVF.tipo)].de_estado(estado)
+
+
+def gerar_consultas_benchmark(faces, amostras=50, semente=0):
+    """Gera consultas de teste perturbando faces da galeria (deslocamento, brilho e ruído)"""
+    rng = np.random.default_rng(semente)
+    passo = max(1, len(faces) // amostras)
+    consultas = []
+    for face in faces[::passo][:amostras]:
+        imagem = np.roll(face, rng.integers(-4, 5, size=2), axis=(0, 1)).astype(np.float32)
+        imagem = imagem * rng.uniform(0.8, 1.2) + rng.normal(0, 8, imagem.shape)
+        consultas.append(np.clip(imagem, 0, 255).astype(np.uint8))
+    return consultas
+
+
+class MotorReconhecimento:
+    """Base dos motores de reconhecimento: galeria de vetores + rótulos"""
+
+    nome = None
+    descricao = None
+    # Motores com busca própria (ex.: pirâmide) não usam índice externo
+    aceita_indice = True
+    # Motores de embeddings podem guardar a galeria quantizada
+    suporta_quantizacao = False
+    # Motores sem etapa de ajuste global aceitam adicionar/remover imagens sem retreinar
+    suporta_incremental = False
+    # Distâncias por produto matricial: comparar um lote contra muitos vetores custa quase o
+    # mesmo que contra poucos, então a busca em lote sempre usa a união dos candidatos
+    distancias_por_produto = False
+
+    def __init__(self):
+        self.galeria = None
+        self.rotulos = np.empty(0, dtype=np.int32)
+        # Geração do cache do dataset (ManifestoDataset) de onde a galeria saiu
+        self.geracao_dataset = None
+
+        # Índice de busca opcional (IVF ou protótipos por pessoa)
+        self.indice = None
+        # Fração das consultas conferidas também com a busca exata
+        self.amostragem_recall = 0.0
+        self.recall_verificacoes = 0
+        self.recall_acertos = 0
+
+        # Latência média das consultas (média móvel exponencial)
+        self.latencia_ms = 0.0
+        self.consultas = 0
+
+    def parametros(self):
+        """Parâmetros do construtor salvos junto com o modelo"""
+        return {}
+
+    def arrays_modelo(self):
+        """Nomes dos atributos numpy que compõem o modelo salvo"""
+        return ['galeria', 'rotulos']
+
+    def arrays_por_imagem(self):
+        """Arrays do modelo com uma linha por imagem da galeria"""
+        return ['galeria', 'rotulos']
+
+    def train(self, faces, labels):
+        raise NotImplementedError
+
+    def atualizado(self, mantidos, faces_novas, rotulos_novos):
+        """Novo motor com as linhas mantidas da galeria e as faces novas anexadas
+
+        Só as faces novas são processadas; o motor atual não é alterado e
+        pode continuar atendendo consultas até a troca.
+        """
+        if not self.suporta_incremental:
+            raise NotImplementedError(f"O motor {self.nome} não suporta atualização incremental")
+
+        novo = self.__class__(**self.parametros())
+        novo.train(faces_novas, rotulos_novos)
+        for nome in self.arrays_por_imagem():
+            atual = getattr(self, nome)
+            adicionados = getattr(novo, nome)
+            combinado = matriz_alinhada((len(mantidos) + len(adicionados),) + atual.shape[1:], atual.dtype)
+            combinado[:len(mantidos)] = atual[mantidos]
+            combinado[len(mantidos):] = adicionados
+            setattr(novo, nome, combinado)
+        novo._apos_carregar()
+        return novo
+
+    def _extrair(self, face):
+        """Converte uma face no vetor de características do motor"""
+        raise NotImplementedError
+
+    def _distancias(self, consulta, indices=None):
+        """Distância entre a consulta e os vetores da galeria (todos ou só os índices)"""
+        raise NotImplementedError
+
+    def _distancias_lote(self, consultas, indices=None):
+        """Matriz de distâncias (consultas x galeria); motores podem vetorizar"""
+        return np.stack([self._distancias(consulta, indices) for consulta in consultas])
+
+    def _confianca(self, distancia):
+        """Converte a distância na escala 0-100 usada pelo limite de confiança"""
+        raise NotImplementedError
+
+    def _vetor_indice(self, consulta):
+        """Representação da consulta no espaço do índice aproximado"""
+        return np.asarray(consulta, dtype=np.float32)
+
+    def _vetores_indice(self):
+        """Galeria no espaço do índice aproximado"""
+        return self.galeria
+
+    def construir_indice(self, tipo=IndiceIVF.tipo, **parametros):
+        """Constrói o índice de busca sobre a galeria atual"""
+        self.indice = INDICES_BUSCA[tipo](**parametros)
+        self.indice.construir(self._vetores_indice(), self.rotulos)
+
+    def busca_aproximada(self):
+        """Indica se _buscar pode descartar candidatos (índice, pirâmide...)"""
+        return self.indice is not None
+
+    def _buscar(self, consulta, exata=False):
+        """Retorna (índice na galeria, distância) do vizinho mais próximo"""
+        candidatos = None
+        if self.indice is not None and not exata:
+            candidatos = self.indice.candidatos(self._vetor_indice(consulta))
+
+        if candidatos is not None and len(candidatos) > 0:
+            distancias = self._distancias(consulta, candidatos)
+            melhor = int(np.argmin(distancias))
+            return int(candidatos[melhor]), float(distancias[melhor])
+
+        distancias = self._distancias(consulta)
+        melhor = int(np.argmin(distancias))
+        return melhor, float(distancias[melhor])
+
+    def _buscar_lote(self, consultas):
+        """_buscar de várias consultas com um único cálculo de distâncias
+
+        Com índice, as listas de todas as consultas saem de uma única sondagem
+        e a união dos candidatos é comparada de uma vez; cada consulta escolhe
+        só entre os seus, então o resultado é o mesmo de _buscar.
+        """
+        if self.indice is None:
+            distancias = self._distancias_lote(consultas)
+            melhores = np.argmin(distancias, axis=1)
+            return [(int(melhor), float(distancias[i, melhor])) for i, melhor in enumerate(melhores)]
+
+        vetores = np.stack([self._vetor_indice(consulta) for consulta in consultas])
+        return self._melhores_entre(consultas, self.indice.candidatos_lote(vetores))
+
+    def _distancias_proprias(self, calcular, consultas, candidatos):
+        """Distâncias de cada consulta aos seus candidatos, via calcular(consultas, indices)
+
+        Quando os candidatos se repetem entre as consultas (ou o motor compara
+        por produto matricial), a união é comparada em uma única chamada e
+        cada consulta lê só as suas colunas; com candidatos quase disjuntos a
+        união multiplicaria o trabalho, então cada consulta usa os seus.
+        """
+        uniao = np.unique(np.concatenate(candidatos))
+        # Fora do produto matricial o custo é por par; a união só compensa com pouca sobra
+        if self.distancias_por_produto or len(consultas) * len(uniao) <= 1.25 * sum(map(len, candidatos)):
+            distancias = calcular(consultas, uniao)
+            return [distancias[i, np.searchsorted(uniao, lista)] for i, lista in enumerate(candidatos)]
+        return [calcular(consultas[i:i + 1], lista)[0] for i, lista in enumerate(candidatos)]
+
+    def _melhores_entre(self, consultas, candidatos):
+        """Vizinho mais próximo de cada consulta entre os seus candidatos"""
+        resultado = [None] * len(consultas)
+        com_candidatos = [i for i, lista in enumerate(candidatos) if len(lista) > 0]
+        if com_candidatos:
+            listas = [candidatos[i] for i in com_candidatos]
+            for i, lista, proprias in zip(com_candidatos, listas, self._distancias_proprias(
+                    self._distancias_lote, consultas[com_candidatos], listas)):
+                melhor = int(np.argmin(proprias))
+                resultado[i] = int(lista[melhor]), float(proprias[melhor])
+
+        # Sem candidatos a consulta cai na busca exata, como em _buscar
+        for i in range(len(consultas)):
+            if resultado[i] is None:
+                resultado[i] = self._buscar(consultas[i], exata=True)
+        return resultado
+
+    def predict(self, face):
+        if len(self.rotulos) == 0:
+            return -1, 100
+
+        inicio = time.perf_counter()
+
+        consulta = self._extrair(face)
+        melhor, distancia = self._buscar(consulta)
+        resultado = int(self.rotulos[melhor]), self._confianca(distancia)
+
+        self._registrar_latencia(time.perf_counter() - inicio)
+
+        if self.busca_aproximada() and np.random.random() < self.amostragem_recall:
+            self._conferir_recall(consulta, melhor)
+
+        return resultado
+
+    def predict_batch(self, faces):
+        """Reconhece várias faces em uma única passada vetorizada
+
+        As faces podem vir de um mesmo quadro ou de câmeras diferentes; o
+        resultado segue a ordem de entrada, com o mesmo (label, confidence)
+        de predict.
+        """
+        if len(faces) == 0:
+            return []
+        if len(self.rotulos) == 0:
+            return [(-1, 100)] * len(faces)
+
+        inicio = time.perf_counter()
+
+        consultas = np.stack([self._extrair(face) for face in faces])
+        encontrados = self._buscar_lote(consultas)
+
+        resultados = [(int(self.rotulos[melhor]), self._confianca(distancia))
+                      for melhor, distancia in encontrados]
+
+        por_face = (time.perf_counter() - inicio) / len(faces)
+        for _ in faces:
+            self._registrar_latencia(por_face)
+
+        if self.busca_aproximada():
+            for consulta, (melhor, _) in zip(consultas, encontrados):
+                if np.random.random() < self.amostragem_recall:
+                    self._conferir_recall(consulta, melhor)
+
+        return resultados
+
+    def _conferir_recall(self, consulta, melhor):
+        """Compara a pessoa encontrada pela busca aproximada com a da busca exata"""
+        exato, _ = self._buscar(consulta, exata=True)
+        self.recall_verificacoes += 1
+        if self.rotulos[exato] == self.rotulos[melhor]:
+            self.recall_acertos += 1
+
+    def recall_medido(self):
+        """Recall do índice nas consultas conferidas (None se não houver)"""
+        if self.recall_verificacoes == 0:
+            return None
+        return self.recall_acertos / self.recall_verificacoes
+
+    def avaliar_recall(self, faces, amostras=100):
+        """Mede recall e ganho de velocidade da busca aproximada contra a exata"""
+        if not self.busca_aproximada() or len(faces) == 0:
+            return None, None
+
+        passo = max(1, len(faces) // amostras)
+        consultas = [self._extrair(face) for face in faces[::passo][:amostras]]
+
+        inicio = time.perf_counter()
+        aproximados = [self._buscar(consulta)[0] for consulta in consultas]
+        tempo_aproximado = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        exatos = [self._buscar(consulta, exata=True)[0] for consulta in consultas]
+        tempo_exato = time.perf_counter() - inicio
+
+        recall = float(np.mean(self.rotulos[aproximados] == self.rotulos[exatos]))
+        return recall, tempo_exato / max(tempo_aproximado, 1e-9)
+
+    def _registrar_latencia(self, segundos):
+        self.consultas += 1
+        peso = 1.0 if self.consultas == 1 else 0.05
+        self.latencia_ms += peso * (segundos * 1000 - self.latencia_ms)
+
+    def medir_latencia(self, faces, amostras=20):
+        """Mede a latência média (ms) de predict sobre algumas faces"""
+        if len(faces) == 0 or len(self.rotulos) == 0:
+            return 0.0
+        passo = max(1, len(faces) // amostras)
+        selecionadas = faces[::passo][:amostras]
+        inicio = time.perf_counter()
+        for face in selecionadas:
+            self.predict(face)
+        return (time.perf_counter() - inicio) * 1000 / len(selecionadas)
+
+    def tamanho_modelo(self):
+        """Tamanho em bytes dos dados do modelo"""
+        total = 0
+        for nome in self.arrays_modelo():
+            valor = getattr(self, nome, None)
+            if valor is not None:
+                total += valor.nbytes
+        if self.indice is not None:
+            total += sum(valor.nbytes for valor in self.indice.arrays().values())
+        return total
+
+    def exportar_estado(self):
+        """Estado serializável do modelo treinado"""
+        return {
+            'motor': self.nome,
+            'parametros': self.parametros(),
+            'arrays': {nome: getattr(self, nome) for nome in self.arrays_modelo()},
+            'indice': self.indice.exportar_estado() if self.indice is not None else None,
+            'geracao_dataset': self.geracao_dataset
+        }
+
+    def importar_estado(self, estado):
+        """Restaura um estado gerado por exportar_estado"""
+        for nome, valor in estado['arrays'].items():
+            setattr(self, nome, alinhar(valor))
+        if estado.get('indice'):
+            self.indice = indice_de_estado(estado['indice'])
+        self.geracao_dataset = estado.get('geracao_dataset')
+        self._apos_carregar()
+
+    def _apos_carregar(self):
+        """Recalcula dados derivados após treinar ou carregar o modelo"""
+        pass
+
+
+def _distancias_l1(galeria, consultas, tamanho_bloco):
+    """Distância média absoluta (consultas x galeria) de vetores uint8
+
+    Cada bloco da galeria é convertido uma única vez e reaproveitado por
+    todas as consultas enquanto ainda está no cache.
+    """
+    distancias = np.empty((len(consultas), len(galeria)), dtype=np.float32)
+    for inicio in range(0, len(galeria), tamanho_bloco):
+        bloco = galeria[inicio:inicio + tamanho_bloco].astype(np.int16)
+        diferenca = np.empty_like(bloco)
+        for i, consulta in enumerate(consultas):
+            np.subtract(bloco, consulta, out=diferenca)
+            np.abs(diferenca, out=diferenca)
+            distancias[i, inicio:inicio + len(bloco)] = diferenca.sum(axis=1, dtype=np.int32)
+    return distancias / galeria.shape[1]
+
+
+class MatcherVetorizado(MotorReconhecimento):
+    """Reconhecedor que compara a face com toda a galeria de uma só vez"""
+
+    nome = 'pixels'
+    descricao = 'Pixels (distância L1)'
+    suporta_incremental = True
+
+    def __init__(self, tamanho_bloco=256):
+        super().__init__()
+        self.dimensao = TAMANHO_COMPARACAO[0] * TAMANHO_COMPARACAO[1]
+        self.galeria = np.empty((0, self.dimensao), dtype=np.uint8)
+        # Limita a memória temporária usada em cada comparação
+        self.tamanho_bloco = tamanho_bloco
+
+    def parametros(self):
+        return {'tamanho_bloco': self.tamanho_bloco}
+
+    def train(self, faces, labels):
+        """Pré-processa a galeria uma única vez em uma matriz contígua e alinhada"""
+        galeria = matriz_alinhada((len(faces), self.dimensao), np.uint8)
+        for i, face in enumerate(faces):
+            galeria[i] = preprocessar_face(face).ravel()
+
+        self.galeria = galeria
+        self.rotulos = np.asarray(labels, dtype=np.int32)
+        return True
+
+    def _extrair(self, face):
+        return preprocessar_face(face).ravel().astype(np.int16)
+
+    def _distancias(self, consulta, indices=None):
+        """Distância média absoluta entre a consulta e cada face da galeria"""
+        return self._distancias_lote(consulta[None, :], indices)[0]
+
+    def _distancias_lote(self, consultas, indices=None):
+        """Distâncias L1 de várias consultas, percorrendo a galeria em blocos"""
+        galeria = self.galeria if indices is None else self.galeria[indices]
+        return _distancias_l1(galeria, consultas, self.tamanho_bloco)
+
+    def _confianca(self, distancia):
+        return min(distancia / 5, 100)
+
+
+class MatcherPiramide(MatcherVetorizado):
+    """Comparação grosso-para-fino: descarta candidatos em resoluções reduzidas"""
+
+    nome = 'piramide'
+    descricao = 'Pixels em pirâmide (25/50/100)'
+    aceita_indice = False
+
+    def __init__(self, tamanho_bloco=256, niveis=(25, 50), margem=0.3, minimo_candidatos=16):
+        super().__init__(tamanho_bloco=tamanho_bloco)
+        self.niveis = tuple(niveis)
+        # Candidatos com distância acima de melhor * (1 + margem) são descartados
+        self.margem = margem
+        # Sempre mantém os N melhores de cada nível, limitando a perda de acerto
+        self.minimo_candidatos = minimo_candidatos
+
+    def parametros(self):
+        return {'tamanho_bloco': self.tamanho_bloco, 'niveis': list(self.niveis),
+                'margem': self.margem, 'minimo_candidatos': self.minimo_candidatos}
+
+    def arrays_modelo(self):
+        return [f'galeria_{lado}' for lado in self.niveis] + ['galeria', 'rotulos']
+
+    def arrays_por_imagem(self):
+        return self.arrays_modelo()
+
+    def _reduzir(self, vetores, lado):
+        """Reduz vetores 100x100 para lado x lado"""
+        reduzidos = matriz_alinhada((len(vetores), lado * lado), np.uint8)
+        for i, vetor in enumerate(vetores):
+            imagem = np.asarray(vetor, dtype=np.uint8).reshape(TAMANHO_COMPARACAO)
+            reduzidos[i] = cv2.resize(imagem, (lado, lado), interpolation=cv2.INTER_AREA).ravel()
+        return reduzidos
+
+    def train(self, faces, labels):
+        """Pré-calcula todos os níveis da pirâmide da galeria"""
+        super().train(faces, labels)
+        for lado in self.niveis:
+            setattr(self, f'galeria_{lado}', self._reduzir(self.galeria, lado))
+        return True
+
+    def busca_aproximada(self):
+        return True
+
+    def _buscar(self, consulta, exata=False):
+        if exata:
+            return super()._buscar(consulta, exata=True)
+
+        candidatos = np.arange(len(self.galeria))
+        for lado in self.niveis:
+            reduzida = self._reduzir(consulta[None, :], lado).astype(np.int16)
+            galeria = getattr(self, f'galeria_{lado}')[candidatos]
+            distancias = _distancias_l1(galeria, reduzida, self.tamanho_bloco)[0]
+
+            limite = distancias.min() * (1 + self.margem)
+            if len(distancias) > self.minimo_candidatos:
+                limite = max(limite, np.partition(distancias, self.minimo_candidatos - 1)[self.minimo_candidatos - 1])
+            candidatos = candidatos[distancias <= limite]
+
+        distancias = self._distancias(consulta, candidatos)
+        melhor = int(np.argmin(distancias))
+        return int(candidatos[melhor]), float(distancias[melhor])
+
+    def _buscar_lote(self, consultas):
+        """Pirâmide de várias consultas: cada nível compara a união dos candidatos de uma vez"""
+        candidatos = [np.arange(len(self.galeria))] * len(consultas)
+        for lado in self.niveis:
+            reduzidas = self._reduzir(consultas, lado).astype(np.int16)
+            galeria = getattr(self, f'galeria_{lado}')
+
+            def calcular(selecionadas, indices):
+                return _distancias_l1(galeria[indices], selecionadas, self.tamanho_bloco)
+
+            filtrados = []
+            for atuais, proprias in zip(candidatos, self._distancias_proprias(calcular, reduzidas, candidatos)):
+                limite = proprias.min() * (1 + self.margem)
+                if len(proprias) > self.minimo_candidatos:
+                    limite = max(limite, np.partition(proprias, self.minimo_candidatos - 1)[self.minimo_candidatos - 1])
+                filtrados.append(atuais[proprias <= limite])
+            candidatos = filtrados
+
+        return self._melhores_entre(consultas, candidatos)
+
+
+def _componentes_principais(dados, componentes, iteracoes=2, semente=0):
+    """PCA aleatorizada: retorna as direções principais (componentes x D)"""
+    rng = np.random.default_rng(semente)
+    alvo = min(componentes + 10, min(dados.shape))
+
+    amostra = dados @ rng.standard_normal((dados.shape[1], alvo)).astype(np.float32)
+    for _ in range(iteracoes):
+        amostra, _ = np.linalg.qr(amostra)
+        amostra = dados @ (dados.T @ amostra)
+    base, _ = np.linalg.qr(amostra)
+
+    _, _, direcoes = np.linalg.svd(base.T @ dados, full_matrices=False)
+    return direcoes[:componentes]
+
+
+class MotorEigenfaces(MotorReconhecimento):
+    """Eigenfaces: projeta as faces em um subespaço PCA compacto"""
+
+    nome = 'eigenfaces'
+    descricao = 'Eigenfaces (PCA)'
+    usar_lda = False
+    suporta_quantizacao = True
+    distancias_por_produto = True
+
+    def __init__(self, componentes=80, quantizacao=None, tamanho_bloco=4096):
+        super().__init__()
+        self.componentes = componentes
+        # None, 'int8' ou 'int4': galeria guardada quantizada e desquantizada em blocos
+        self.quantizacao = quantizacao
+        self.tamanho_bloco = tamanho_bloco
+        self.media = None
+        self.projecao = None
+        self.escala_quantizacao = None
+        self.normas = None
+        self.escala = 1.0
+
+    def parametros(self):
+        return {'componentes': self.componentes, 'quantizacao': self.quantizacao,
+                'tamanho_bloco': self.tamanho_bloco}
+
+    def arrays_modelo(self):
+        arrays = ['media', 'projecao', 'galeria', 'normas', 'rotulos']
+        if self.quantizacao:
+            arrays.append('escala_quantizacao')
+        return arrays
+
+    def train(self, faces, labels):
+        """Aprende a projeção e guarda apenas os vetores projetados"""
+        rotulos = np.asarray(labels, dtype=np.int32)
+        dados = np.empty((len(faces), TAMANHO_COMPARACAO[0] * TAMANHO_COMPARACAO[1]), dtype=np.float32)
+        for i, face in enumerate(faces):
+            dados[i] = preprocessar_face(face).ravel()
+
+        if len(dados) < 2:
+            return False
+
+        media = dados.mean(axis=0)
+        dados -= media
+
+        classes = np.unique(rotulos)
+        if self.usar_lda and len(classes) >= 2:
+            componentes_pca = max(1, min(len(dados) - len(classes), self.componentes))
+            projecao = _componentes_principais(dados, componentes_pca).T
+            projecao = projecao @ self._discriminantes(dados @ projecao, rotulos, classes)
+        else:
+            componentes = min(self.componentes, len(dados) - 1)
+            projecao = _componentes_principais(dados, componentes).T
+
+        self.media = media
+        self.projecao = alinhar(np.ascontiguousarray(projecao, dtype=np.float32))
+        projetados = dados @ self.projecao
+        if self.quantizacao:
+            self.galeria, self.escala_quantizacao = quantizar(projetados, QUANTIZACOES[self.quantizacao])
+        else:
+            self.galeria = alinhar(np.ascontiguousarray(projetados, dtype=np.float32))
+        self.rotulos = rotulos
+        self.normas = None
+        self._apos_carregar()
+        return True
+
+    def _discriminantes(self, projetados, rotulos, classes):
+        """Direções LDA (Fisherfaces) no espaço PCA"""
+        media_global = projetados.mean(axis=0)
+        dim = projetados.shape[1]
+        dispersao_intra = np.zeros((dim, dim), dtype=np.float64)
+        dispersao_entre = np.zeros((dim, dim), dtype=np.float64)
+
+        for classe in classes:
+            membros = projetados[rotulos == classe]
+            media_classe = membros.mean(axis=0)
+            centrados = membros - media_classe
+            dispersao_intra += centrados.T @ centrados
+            diferenca = (media_classe - media_global)[:, None]
+            dispersao_entre += len(membros) * (diferenca @ diferenca.T)
+
+        # Regularização evita matriz singular com poucas imagens por pessoa
+        dispersao_intra += np.eye(dim) * 1e-3 * np.trace(dispersao_intra) / dim
+
+        autovalores, autovetores = np.linalg.eig(np.linalg.solve(dispersao_intra, dispersao_entre))
+        ordem = np.argsort(-autovalores.real)[:min(len(classes) - 1, dim)]
+        return autovetores[:, ordem].real
+
+    def _blocos_float(self, galeria):
+        """Percorre a galeria em blocos float32, desquantizando se necessário"""
+        for inicio in range(0, len(galeria), self.tamanho_bloco):
+            bloco = galeria[inicio:inicio + self.tamanho_bloco]
+            if self.quantizacao:
+                bloco = desquantizar(bloco, self.escala_quantizacao, QUANTIZACOES[self.quantizacao])
+            yield inicio, bloco
+
+    def _vetores_indice(self):
+        if not self.quantizacao:
+            return self.galeria
+        return np.concatenate([bloco for _, bloco in self._blocos_float(self.galeria)])
+
+    def _apos_carregar(self):
+        if self.normas is None:
+            self.normas = np.empty(len(self.galeria), dtype=np.float32)
+            for inicio, bloco in self._blocos_float(self.galeria):
+                self.normas[inicio:inicio + len(bloco)] = np.einsum('ij,ij->i', bloco, bloco)
+        # Espalhamento típico da galeria, usado para normalizar a confiança
+        self.escala = float(np.sqrt(self.normas.mean())) or 1.0
+
+    def _extrair(self, face):
+        vetor = preprocessar_face(face).ravel().astype(np.float32) - self.media
+        return vetor @ self.projecao
+
+    def _distancias(self, consulta, indices=None):
+        """Distância euclidiana via produto escalar no subespaço"""
+        return self._distancias_lote(consulta[None, :], indices)[0]
+
+    def _distancias_lote(self, consultas, indices=None):
+        """Distâncias euclidianas de várias consultas por produto matricial"""
+        if indices is None:
+            galeria, normas = self.galeria, self.normas
+        else:
+            galeria, normas = self.galeria[indices], self.normas[indices]
+
+        if self.quantizacao:
+            produtos = np.empty((len(consultas), len(galeria)), dtype=np.float32)
+            for inicio, bloco in self._blocos_float(galeria):
+                produtos[:, inicio:inicio + len(bloco)] = consultas @ bloco.T
+        else:
+            produtos = consultas @ galeria.T
+
+        quadrados = normas[None, :] - 2 * produtos + np.einsum('ij,ij->i', consultas, consultas)[:, None]
+        return np.sqrt(np.maximum(quadrados, 0))
+
+    def _confianca(self, distancia):
+        return min(100 * distancia / self.escala, 100)
+
+
+class MotorFisherfaces(MotorEigenfaces):
+    """Fisherfaces: LDA sobre o subespaço PCA"""
+
+    nome = 'fisherfaces'
+    descricao = 'Fisherfaces (PCA + LDA)'
+    usar_lda = True
+
+    def __init__(self, componentes=150, quantizacao=None, tamanho_bloco=4096):
+        super().__init__(componentes=componentes, quantizacao=quantizacao, tamanho_bloco=tamanho_bloco)
+
+
+def _tabela_lbp_uniforme():
+    """Mapeia os 256 códigos LBP para 58 padrões uniformes + 1 bin para os demais"""
+    tabela = np.full(256, 58, dtype=np.uint8)
+    proximo = 0
+    for codigo in range(256):
+        bits = [(codigo >> i) & 1 for i in range(8)]
+        transicoes = sum(bits[i] != bits[(i + 1) % 8] for i in range(8))
+        if transicoes <= 2:
+            tabela[codigo] = proximo
+            proximo += 1
+    return tabela
+
+
+TABELA_LBP_UNIFORME = _tabela_lbp_uniforme()
+BINS_LBP = 59
+
+
+class MotorLBPH(MotorReconhecimento):
+    """Histogramas de padrões binários locais (LBP) comparados por qui-quadrado"""
+
+    nome = 'lbph'
+    descricao = 'LBP (histogramas)'
+    suporta_incremental = True
+
+    # Vizinhos no sentido horário a partir do canto superior esquerdo
+    VIZINHOS = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+
+    def __init__(self, grade=8, tamanho_bloco=512):
+        super().__init__()
+        self.grade = grade
+        self.tamanho_bloco = tamanho_bloco
+        self.celulas = None
+        self.dimensao = grade * grade * BINS_LBP
+        self.galeria = np.empty((0, self.dimensao), dtype=np.float32)
+
+    def parametros(self):
+        return {'grade': self.grade, 'tamanho_bloco': self.tamanho_bloco}
+
+    def _indice_celulas(self, altura, largura):
+        """Índice da célula da grade de cada pixel do mapa LBP"""
+        linhas = np.minimum(np.arange(altura) * self.grade // altura, self.grade - 1)
+        colunas = np.minimum(np.arange(largura) * self.grade // largura, self.grade - 1)
+        return (linhas[:, None] * self.grade + colunas[None, :]).ravel() * BINS_LBP
+
+    def _extrair(self, face):
+        """Histograma LBP uniforme concatenado das células da grade"""
+        imagem = preprocessar_face(face).astype(np.int16)
+        centro = imagem[1:-1, 1:-1]
+        altura, largura = centro.shape
+
+        codigos = np.zeros(centro.shape, dtype=np.uint8)
+        for bit, (dy, dx) in enumerate(self.VIZINHOS):
+            vizinho = imagem[1 + dy:1 + dy + altura, 1 + dx:1 + dx + largura]
+            codigos |= (vizinho >= centro).astype(np.uint8) << bit
+
+        if self.celulas is None or len(self.celulas) != altura * largura:
+            self.celulas = self._indice_celulas(altura, largura)
+
+        indices = self.celulas + TABELA_LBP_UNIFORME[codigos.ravel()]
+        histograma = np.bincount(indices, minlength=self.dimensao).astype(np.float32)
+
+        # Normaliza cada célula para somar 1
+        histograma = histograma.reshape(-1, BINS_LBP)
+        histograma /= np.maximum(histograma.sum(axis=1, keepdims=True), 1)
+        return histograma.ravel()
+
+    def train(self, faces, labels):
+        """Calcula os histogramas da galeria uma única vez"""
+        galeria = matriz_alinhada((len(faces), self.dimensao), np.float32)
+        for i, face in enumerate(faces):
+            galeria[i] = self._extrair(face)
+
+        self.galeria = galeria
+        self.rotulos = np.asarray(labels, dtype=np.int32)
+        return True
+
+    def _distancias(self, consulta, indices=None):
+        """Distância qui-quadrado vetorizada contra a galeria"""
+        return self._distancias_lote(consulta[None, :], indices)[0]
+
+    def _distancias_lote(self, consultas, indices=None):
+        """Qui-quadrado de várias consultas, percorrendo a galeria em blocos"""
+        galeria = self.galeria if indices is None else self.galeria[indices]
+        distancias = np.empty((len(consultas), len(galeria)), dtype=np.float32)
+        for inicio in range(0, len(galeria), self.tamanho_bloco):
+            bloco = galeria[inicio:inicio + self.tamanho_bloco]
+            diferenca = np.empty_like(bloco)
+            soma = np.empty_like(bloco)
+            for i, consulta in enumerate(consultas):
+                np.subtract(bloco, consulta, out=diferenca)
+                np.add(bloco, consulta, out=soma)
+                # O epsilon evita divisão por zero em bins vazios nos dois histogramas
+                soma += np.float32(1e-10)
+                diferenca *= diferenca
+                diferenca /= soma
+                distancias[i, inicio:inicio + len(bloco)] = diferenca.sum(axis=1)
+        return distancias
+
+    def _vetor_indice(self, consulta):
+        # Raiz dos histogramas (Hellinger): L2 nesse espaço aproxima o qui-quadrado
+        return np.sqrt(consulta)
+
+    def _vetores_indice(self):
+        return np.sqrt(self.galeria)
+
+    def _confianca(self, distancia):
+        # Qui-quadrado médio por célula (0 a 2) convertido para 0-100
+        return min(100 * distancia / (self.grade * self.grade), 100)
+
+
+MOTORES_RECONHECIMENTO = {
+    motor.nome: motor for motor in (MatcherVetorizado, MatcherPiramide, MotorEigenfaces, MotorFisherfaces,
+                                    MotorLBPH)
+}
+
+
+def criar_motor(nome, **parametros):
+    """Cria um motor de reconhecimento pelo nome"""
+    return MOTORES_RECONHECIMENTO.get(nome, MatcherVetorizado)(**parametros)
+
+
+def motor_de_estado(estado):
+    """Reconstrói um motor a partir do estado salvo"""
+    motor = criar_motor(estado['motor'], **estado.get('parametros', {}))
+    motor.importar_estado(estado)
+    return motor
+
+
+MAGICO_MODELO = b'RFMODEL1'
+ALINHAMENTO_MODELO = 64
+
+
+def salvar_modelo_binario(estado, caminho):
+    """Salva o estado do motor no formato binário: cabeçalho JSON + matrizes brutas
+
+    Layout: MAGICO_MODELO, tamanho do cabeçalho (uint32 little-endian),
+    cabeçalho JSON e, em seguida, cada matriz em um deslocamento alinhado.
+    O arquivo é escrito em um temporário e publicado com os.replace.
+    """
+    secoes = [('arrays', estado['arrays'])]
+    if estado.get('indice'):
+        secoes.append(('indice', estado['indice']['arrays']))
+
+    descricoes = {}
+    blocos = []
+    deslocamento = 0
+    for secao, arrays in secoes:
+        descricoes[secao] = {}
+        for nome, valor in arrays.items():
+            valor = np.ascontiguousarray(valor)
+            deslocamento += (-deslocamento) % ALINHAMENTO_MODELO
+            descricoes[secao][nome] = {'dtype': valor.dtype.str, 'shape': list(valor.shape),
+                                       'offset': deslocamento}
+            blocos.append((deslocamento, valor))
+            deslocamento += valor.nbytes
+
+    cabecalho = {
+        'versao': 1,
+        'motor': estado['motor'],
+        'parametros': estado['parametros'],
+        'indice': ({'tipo': estado['indice']['tipo'], 'parametros': estado['indice']['parametros']}
+                   if estado.get('indice') else None),
+        'geracao_dataset': estado.get('geracao_dataset'),
+        'arrays': descricoes
+    }
+
+    # Os deslocamentos do cabeçalho são relativos ao início da área de dados
+    texto = json.dumps(cabecalho).encode('utf-8')
+    inicio_dados = len(MAGICO_MODELO) + 4 + len(texto)
+    inicio_dados += (-inicio_dados) % ALINHAMENTO_MODELO
+
+    temporario = f"{caminho}.tmp"
+    with open(temporario, 'wb') as f:
+        f.write(MAGICO_MODELO)
+        f.write(struct.pack('<I', len(texto)))
+        f.write(texto)
+        for deslocamento, valor in blocos:
+            f.write(b'\0' * (inicio_dados + deslocamento - f.tell()))
+            f.write(valor.tobytes())
+    os.replace(temporario, caminho)
+
+
+def carregar_modelo_binario(caminho):
+    """Abre um modelo binário com as matrizes mapeadas em memória (somente leitura)"""
+    with open(caminho, 'rb') as f:
+        if f.read(len(MAGICO_MODELO)) != MAGICO_MODELO:
+            raise ValueError(f"{caminho} não é um modelo binário válido")
+        tamanho = struct.unpack('<I', f.read(4))[0]
+        cabecalho = json.loads(f.read(tamanho).decode('utf-8'))
+
+    inicio_dados = len(MAGICO_MODELO) + 4 + tamanho
+    inicio_dados += (-inicio_dados) % ALINHAMENTO_MODELO
+
+    secoes = {}
+    for secao, arrays in cabecalho['arrays'].items():
+        secoes[secao] = {}
+        for nome, descricao in arrays.items():
+            dtype = np.dtype(descricao['dtype'])
+            formato = tuple(descricao['shape'])
+            if int(np.prod(formato)) == 0:
+                secoes[secao][nome] = np.empty(formato, dtype=dtype)
+            else:
+                secoes[secao][nome] = np.memmap(caminho, dtype=dtype, mode='r', shape=formato,
+                                                offset=inicio_dados + descricao['offset'])
+
+    estado = {
+        'motor': cabecalho['motor'],
+        'parametros': cabecalho['parametros'],
+        'arrays': secoes.get('arrays', {}),
+        'indice': None,
+        'geracao_dataset': cabecalho.get('geracao_dataset')
+    }
+    if cabecalho.get('indice'):
+        estado['indice'] = dict(cabecalho['indice'], arrays=secoes.get('indice', {}))
+    return estado
+
+
+def converter_pickle_para_binario(caminho_pickle, caminho_binario):
+    """Converte um model_data.pkl (formato antigo ou estado de motor) para o formato binário"""
+    with open(caminho_pickle, 'rb') as f:
+        model_data = pickle.load(f)
+
+    if 'motor' not in model_data:
+        # Formato antigo: faces brutas de 200x200, usadas pelo motor de pixels
+        motor = MatcherVetorizado()
+        motor.train(model_data.get('faces', []), model_data.get('labels', []))
+        model_data = motor.exportar_estado()
+
+    salvar_modelo_binario(model_data, caminho_binario)
+    return model_data
+
+
+EXTENSOES_DATASET = ('.jpg', '.png')
+
+
+def carregar_face_dataset(caminho):
+    """Lê uma foto do dataset já reduzida para o tamanho de comparação (None se inválida)
+
+    A equalização final fica a cargo de preprocessar_face nos motores, que
+    reduz para o mesmo tamanho; assim a face do cache gera o mesmo vetor
+    que a foto original.
+    """
+    img = cv2.imread(caminho, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return None
+    img = cv2.equalizeHist(cv2.resize(img, (200, 200)))
+    return cv2.resize(img, TAMANHO_COMPARACAO)
+
+
+def _hash_arquivo(caminho):
+    """SHA-1 do conteúdo do arquivo"""
+    h = hashlib.sha1()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _processar_arquivo_dataset(caminho):
+    """Decodifica e calcula o hash de uma foto (executado nas threads de carregamento)"""
+    return carregar_face_dataset(caminho), _hash_arquivo(caminho)
+
+
+class TreinamentoCancelado(Exception):
+    """Treinamento interrompido a pedido do usuário"""
+
+
+class TarefaTreinamento:
+    """Estado de um treinamento em segundo plano: etapa, progresso, ETA e cancelamento
+
+    ao_progredir recebe um dicionário com o progresso; é chamado na thread
+    do treinamento, no máximo a cada `intervalo` segundos durante o
+    carregamento das fotos.
+    """
+
+    def __init__(self, ao_progredir, intervalo=0.1):
+        self.ao_progredir = ao_progredir
+        self.intervalo = intervalo
+        self.cancelado = threading.Event()
+        self.thread = None
+        self.inicio = time.perf_counter()
+        self.inicio_etapa = self.inicio
+        self.ultimo_aviso = 0.0
+
+    def cancelar(self):
+        self.cancelado.set()
+
+    def ativa(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def verificar(self):
+        """Interrompe o treinamento se o cancelamento foi pedido"""
+        if self.cancelado.is_set():
+            raise TreinamentoCancelado()
+
+    def etapa(self, descricao):
+        self.verificar()
+        self.inicio_etapa = time.perf_counter()
+        self.ao_progredir({'etapa': descricao, 'fracao': None, 'eta': None})
+
+    def arquivos(self, feitos, total, pessoas_feitas, pessoas_total):
+        """Progresso do carregamento das fotos, com ETA pela taxa observada"""
+        agora = time.perf_counter()
+        if feitos < total and agora - self.ultimo_aviso < self.intervalo:
+            return
+        self.ultimo_aviso = agora
+        decorrido = agora - self.inicio_etapa
+        self.ao_progredir({
+            'etapa': 'Carregando fotos',
+            'arquivos_feitos': feitos,
+            'arquivos_total': total,
+            'pessoas_feitas': pessoas_feitas,
+            'pessoas_total': pessoas_total,
+            'fracao': feitos / total if total else 1.0,
+            'eta': decorrido / feitos * (total - feitos) if feitos else None
+        })
+
+
+class ManifestoDataset:
+    """Manifesto do dataset com cache das faces já pré-processadas
+
+    trainer/manifesto.json guarda, por arquivo, caminho, mtime, tamanho,
+    hash, rótulo e a linha correspondente em trainer/cache_faces.npy.
+    Só arquivos novos ou alterados são decodificados novamente, em paralelo.
+    A geração (hash do conteúdo e rótulo de cada linha, em ordem) identifica
+    o cache; um modelo só reaproveita linhas do cache de que foi gerado.
+    """
+
+    def __init__(self, dataset_dir="dataset", trainer_dir="trainer", trabalhadores=None):
+        self.dataset_dir = dataset_dir
+        # O OpenCV libera o GIL em imread/resize/equalizeHist, então threads escalam com os núcleos
+        self.trabalhadores = trabalhadores or os.cpu_count() or 1
+        self.caminho_manifesto = os.path.join(trainer_dir, "manifesto.json")
+        self.caminho_cache = os.path.join(trainer_dir, "cache_faces.npy")
+        self.formato_face = (TAMANHO_COMPARACAO[1], TAMANHO_COMPARACAO[0])
+
+    def escanear(self):
+        """Fotos de dataset/User_* com rótulo, mtime e tamanho"""
+        arquivos = {}
+        for user_dir in sorted(os.listdir(self.dataset_dir)):
+            user_path = os.path.join(self.dataset_dir, user_dir)
+            if not user_dir.startswith("User_") or not os.path.isdir(user_path):
+                continue
+            try:
+                user_id = int(user_dir.replace("User_", ""))
+            except ValueError:
+                continue
+
+            for nome in sorted(os.listdir(user_path)):
+                if nome.lower().endswith(EXTENSOES_DATASET):
+                    caminho = os.path.join(user_path, nome)
+                    info = os.stat(caminho)
+                    arquivos[Path(caminho).as_posix()] = {
+                        'rotulo': user_id, 'mtime': info.st_mtime, 'tamanho': info.st_size
+                    }
+        return arquivos
+
+    @staticmethod
+    def geracao(arquivos):
+        """Identificador das linhas do cache: hash e rótulo de cada linha, na ordem"""
+        linhas = sorted((info['linha'], info['hash'], info['rotulo']) for info in arquivos.values()
+                        if info['linha'] is not None)
+        texto = "\n".join(f"{hash_}:{rotulo}" for _, hash_, rotulo in linhas)
+        return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+    def _carregar(self):
+        """Manifesto e cache anteriores (vazios se ausentes ou inconsistentes)"""
+        try:
+            with open(self.caminho_manifesto, 'r', encoding='utf-8') as f:
+                arquivos = json.load(f)['arquivos']
+            cache = np.load(self.caminho_cache, mmap_mode='r')
+            linhas = sum(1 for info in arquivos.values() if info['linha'] is not None)
+            if len(cache) == linhas and cache.shape[1:] == self.formato_face:
+                return arquivos, cache
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}, None
+
+    def _salvar(self, arquivos, faces=None):
+        """Grava cache (se informado) e manifesto em temporários e publica com os.replace"""
+        os.makedirs(os.path.dirname(self.caminho_cache), exist_ok=True)
+        if faces is not None:
+            with open(f"{self.caminho_cache}.tmp", 'wb') as f:
+                np.save(f, faces)
+            os.replace(f"{self.caminho_cache}.tmp", self.caminho_cache)
+
+        with open(f"{self.caminho_manifesto}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'versao': 1, 'geracao': self.geracao(arquivos), 'arquivos': arquivos}, f)
+        os.replace(f"{self.caminho_manifesto}.tmp", self.caminho_manifesto)
+
+    def atualizar(self, progresso=None, cancelado=None):
+        """Sincroniza o cache com o dataset e retorna as faces e o que mudou
+
+        As linhas mantidas ficam no início, na ordem do cache anterior,
+        seguidas das faces novas ou alteradas. progresso(feitos, total,
+        pessoas_feitas, pessoas_total) é chamado a cada foto decodificada;
+        se o evento `cancelado` for sinalizado, levanta TreinamentoCancelado
+        sem alterar manifesto nem cache.
+        """
+        atuais = self.escanear()
+        anteriores, cache = self._carregar()
+        geracao_anterior = self.geracao(anteriores) if cache is not None else None
+
+        mantidos = []
+        invalidos = {}
+        pendentes = []
+        for caminho, info in atuais.items():
+            antigo = anteriores.get(caminho)
+            if antigo is not None and antigo['rotulo'] == info['rotulo']:
+                inalterado = antigo['mtime'] == info['mtime'] and antigo['tamanho'] == info['tamanho']
+                if not inalterado and _hash_arquivo(caminho) == antigo['hash']:
+                    # Conteúdo igual com mtime novo (ex.: arquivo copiado de volta)
+                    inalterado = True
+                if inalterado:
+                    if antigo['linha'] is None:
+                        invalidos[caminho] = antigo['hash']
+                    else:
+                        mantidos.append((antigo['linha'], caminho, antigo['hash']))
+                    continue
+            pendentes.append(caminho)
+
+        # Mantém a ordem do cache anterior para que os motores reaproveitem suas linhas
+        mantidos.sort()
+        linhas_mantidas = np.array([linha for linha, _, _ in mantidos], dtype=np.int64)
+
+        rotulos_anteriores = np.empty(len(cache) if cache is not None else 0, dtype=np.int32)
+        for info in anteriores.values():
+            if info['linha'] is not None:
+                rotulos_anteriores[info['linha']] = info['rotulo']
+
+        removidos = len(rotulos_anteriores) - len(mantidos)
+        novos = []
+        inicio = time.perf_counter()
+        cache_alterado = cache is None or pendentes or removidos
+        if not cache_alterado:
+            # Nenhuma face mudou: usa o cache mapeado diretamente
+            faces = cache
+        else:
+            # As faces decodificadas são gravadas direto na matriz final, na ordem dos arquivos
+            faces = np.empty((len(mantidos) + len(pendentes),) + self.formato_face, dtype=np.uint8)
+            if len(mantidos):
+                faces[:len(mantidos)] = cache[linhas_mantidas]
+            linha = len(mantidos)
+            rotulos_pendentes = [atuais[caminho]['rotulo'] for caminho in pendentes]
+            pessoas_total = len(set(rotulos_pendentes))
+            pessoas_feitas = 0
+            with ThreadPoolExecutor(max_workers=self.trabalhadores) as executor:
+                resultados = executor.map(_processar_arquivo_dataset, pendentes)
+                for feitos, (caminho, (face, hash_)) in enumerate(zip(pendentes, resultados), 1):
+                    if cancelado is not None and cancelado.is_set():
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        raise TreinamentoCancelado()
+
+                    # As fotos de cada pessoa são contíguas (ordem de escanear)
+                    if feitos == len(pendentes) or rotulos_pendentes[feitos] != rotulos_pendentes[feitos - 1]:
+                        pessoas_feitas += 1
+                    if progresso is not None:
+                        progresso(feitos, len(pendentes), pessoas_feitas, pessoas_total)
+
+                    if face is None:
+                        invalidos[caminho] = hash_
+                    else:
+                        faces[linha] = face
+                        novos.append((caminho, hash_))
+                        linha += 1
+            faces = faces[:linha]
+            # Libera o mapeamento antes de substituir o arquivo (necessário no Windows)
+            cache = None
+        segundos = time.perf_counter() - inicio
+
+        arquivos = {}
+        ordem = [(caminho, hash_) for _, caminho, hash_ in mantidos] + novos
+        for linha, (caminho, hash_) in enumerate(ordem):
+            arquivos[caminho] = dict(atuais[caminho], hash=hash_, linha=linha)
+        for caminho, hash_ in invalidos.items():
+            arquivos[caminho] = dict(atuais[caminho], hash=hash_, linha=None)
+
+        if arquivos != anteriores:
+            self._salvar(arquivos, faces if cache_alterado else None)
+
+        return {
+            'faces': faces,
+            'rotulos': np.array([atuais[caminho]['rotulo'] for caminho, _ in ordem], dtype=np.int32),
+            'mantidos': linhas_mantidas,
+            'rotulos_anteriores': rotulos_anteriores,
+            'geracao': self.geracao(arquivos),
+            'geracao_anterior': geracao_anterior,
+            'novos': len(novos),
+            'removidos': removidos,
+            'invalidos': len(invalidos),
+            'imagens_por_segundo': len(pendentes) / segundos if pendentes and segundos > 0 else 0.0
+        }
+
+
+class MedidorFPS:
+    """Taxa de eventos por segundo em uma janela deslizante"""
+
+    def __init__(self, janela=2.0):
+        self.janela = janela
+        self.instantes = deque()
+        self.total = 0
+
+    def registrar(self):
+        agora = time.perf_counter()
+        self.instantes.append(agora)
+        self.total += 1
+        while self.instantes and agora - self.instantes[0] > self.janela:
+            self.instantes.popleft()
+
+    def fps(self):
+        if len(self.instantes) < 2:
+            return 0.0
+        return (len(self.instantes) - 1) / max(self.instantes[-1] - self.instantes[0], 1e-9)
+
+
+def iou(a, b):
+    """Interseção sobre união de duas caixas (x, y, w, h)"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    largura = min(ax + aw, bx + bw) - max(ax, bx)
+    altura = min(ay + ah, by + bh) - max(ay, by)
+    if largura <= 0 or altura <= 0:
+        return 0.0
+    intersecao = largura * altura
+    return intersecao / float(aw * ah + bw * bh - intersecao)
+
+
+def intersecao(a, b):
+    """Retângulo comum a duas caixas (x, y, w, h), ou None se não se tocam"""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def agrupar_zonas(zonas):
+    """Junta as zonas (x, y, w, h) que se sobrepõem no retângulo que as envolve
+
+    Cada zona cabe inteira em um dos retângulos, então qualquer face dentro
+    de uma zona pode ser encontrada; os grupos são fundidos até nenhum tocar
+    outro, para que nenhuma área seja varrida duas vezes.
+    """
+    grupos = [tuple(zona) for zona in zonas if zona[2] > 0 and zona[3] > 0]
+    fundiu = True
+    while fundiu:
+        fundiu = False
+        restantes = []
+        for zona in grupos:
+            for i, grupo in enumerate(restantes):
+                if intersecao(zona, grupo) is not None:
+                    x0, y0 = min(zona[0], grupo[0]), min(zona[1], grupo[1])
+                    x1 = max(zona[0] + zona[2], grupo[0] + grupo[2])
+                    y1 = max(zona[1] + zona[3], grupo[1] + grupo[3])
+                    restantes[i] = (x0, y0, x1 - x0, y1 - y0)
+                    fundiu = True
+                    break
+            else:
+                restantes.append(zona)
+        grupos = restantes
+    return grupos
+
+
+def dentro_das_zonas(caixa, zonas):
+    """Indica se o centro da caixa (x, y, w, h) está em alguma das zonas"""
+    cx, cy = caixa[0] + caixa[2] / 2, caixa[1] + caixa[3] / 2
+    return any(x <= cx < x + w and y <= cy < y + h for x, y, w, h in zonas)
+
+
+def zonas_em_pixels(zonas, largura, altura):
+    """Converte zonas guardadas em frações do quadro para pixels"""
+    regioes = []
+    for x, y, w, h in zonas:
+        x0, y0 = int(round(x * largura)), int(round(y * altura))
+        x1, y1 = int(round((x + w) * largura)), int(round((y + h) * altura))
+        if x1 > x0 and y1 > y0:
+            regioes.append((x0, y0, x1 - x0, y1 - y0))
+    return regioes
+
+
+def detectar_faces_escala(cascade, gray, escala=1.0, min_lado=80, scaleFactor=1.1, minNeighbors=5):
+    """Detecta em uma cópia reduzida e devolve as caixas em coordenadas da imagem original
+
+    O tamanho mínimo é reduzido na mesma proporção, então as faces procuradas
+    são as mesmas; só deixam de ser percorridas as escalas pequenas demais.
+    Uma região menor que o tamanho mínimo não tem onde caber uma face.
+    """
+    altura, largura = gray.shape[:2]
+    if altura < min_lado or largura < min_lado:
+        return []
+    if escala >= 1.0:
+        return cascade.detectMultiScale(gray, scaleFactor=scaleFactor, minNeighbors=minNeighbors,
+                                        minSize=(min_lado, min_lado))
+
+    reduzida = cv2.resize(gray, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+    minimo = max(1, int(round(min_lado * escala)))
+    faces = cascade.detectMultiScale(reduzida, scaleFactor=scaleFactor, minNeighbors=minNeighbors,
+                                     minSize=(minimo, minimo))
+    if len(faces) == 0:
+        return faces
+
+    caixas = np.round(np.asarray(faces, dtype=np.float32) / escala).astype(np.int32)
+    caixas[:, 0] = np.clip(caixas[:, 0], 0, largura - 1)
+    caixas[:, 1] = np.clip(caixas[:, 1], 0, altura - 1)
+    caixas[:, 2] = np.minimum(caixas[:, 2], largura - caixas[:, 0])
+    caixas[:, 3] = np.minimum(caixas[:, 3], altura - caixas[:, 1])
+    return caixas
+
+
+def buscar_face_local(cascade, gray, caixa, margem=0.5, escala=1.0, scaleFactor=1.1, minNeighbors=5):
+    """Procura a face só na vizinhança da última caixa conhecida; devolve a nova caixa ou None
+
+    A região é a caixa ampliada por `margem` de cada lado e o tamanho mínimo
+    acompanha o da face, então a varredura é uma fração da do quadro inteiro.
+    """
+    x, y, w, h = (int(v) for v in caixa)
+    altura, largura = gray.shape[:2]
+    dx, dy = int(w * margem), int(h * margem)
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(largura, x + w + dx), min(altura, y + h + dy)
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return None
+
+    faces = detectar_faces_escala(cascade, gray[y0:y1, x0:x1], escala, min_lado=max(1, int(0.7 * min(w, h))),
+                                  scaleFactor=scaleFactor, minNeighbors=minNeighbors)
+    if len(faces) == 0:
+        return None
+    candidatas = [(int(fx) + x0, int(fy) + y0, int(fw), int(fh)) for fx, fy, fw, fh in faces]
+    return max(candidatas, key=lambda candidata: iou(candidata, caixa))
+
+
+def benchmark_escalas_deteccao(cascade, imagens, escalas=(1.0, 0.75, 0.5, 0.33), min_lado=80, limite_iou=0.5):
+    """Tempo médio de detecção e recall (vs. resolução total) para cada escala
+
+    Retorna {escala: (ms por imagem, recall)}; uma face conta como
+    encontrada quando alguma caixa da escala tem IoU >= limite_iou.
+    """
+    referencia = [detectar_faces_escala(cascade, gray, 1.0, min_lado) for gray in imagens]
+    total = sum(len(faces) for faces in referencia)
+
+    resultados = {}
+    for escala in escalas:
+        inicio = time.perf_counter()
+        detectadas = [detectar_faces_escala(cascade, gray, escala, min_lado) for gray in imagens]
+        tempo_ms = (time.perf_counter() - inicio) * 1000 / max(len(imagens), 1)
+
+        encontradas = sum(1 for faces, caixas in zip(referencia, detectadas) for face in faces
+                          if any(iou(face, caixa) >= limite_iou for caixa in caixas))
+        resultados[escala] = (tempo_ms, encontradas / total if total else None)
+    return resultados
+
+
+class CapturaCamera:
+    """Thread dedicada à leitura da câmera, guardando só o quadro mais recente
+
+    O driver é esvaziado continuamente; quem processa sempre recebe a imagem
+    mais nova e os quadros que ninguém consumiu contam como descartados.
+    """
+
+    def __init__(self, indice, largura=640, altura=480):
+        self.indice = indice
+        self.largura = largura
+        self.altura = altura
+        self.cap = None
+        self.thread = None
+        self.ativa = False
+
+        self._condicao = threading.Condition()
+        self._quadro = None
+        self._numero = 0
+        self._consumido = 0
+
+        self.fps_captura = MedidorFPS()
+        self.descartados = 0
+
+    def iniciar(self):
+        """Abre o dispositivo e inicia a thread de captura (False se não abrir)"""
+        self.cap = cv2.VideoCapture(self.indice)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.largura)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.altura)
+        # Nem todos os backends respeitam, mas reduz quadros velhos no driver
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if not self.cap.isOpened():
+            self.cap.release()
+            self.cap = None
+            return False
+
+        self.ativa = True
+        self.thread = threading.Thread(target=self._capturar, daemon=True)
+        self.thread.start()
+        return True
+
+    def _capturar(self):
+        while self.ativa:
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            with self._condicao:
+                if self._numero > self._consumido:
+                    self.descartados += 1
+                self._quadro = frame
+                self._numero += 1
+                self.fps_captura.registrar()
+                self._condicao.notify_all()
+
+        with self._condicao:
+            self.ativa = False
+            self._condicao.notify_all()
+
+    def ler(self, tempo_limite=1.0):
+        """Espera um quadro mais novo que o último lido (None se parou ou expirou)"""
+        with self._condicao:
+            self._condicao.wait_for(lambda: self._numero > self._consumido or not self.ativa, tempo_limite)
+            if self._numero <= self._consumido:
+                return None
+            self._consumido = self._numero
+            return self._quadro
+
+    def estatisticas(self):
+        return {
+            'capturados': self._numero,
+            'descartados': self.descartados,
+            'fps_captura': self.fps_captura.fps()
+        }
+
+    def parar(self):
+        with self._condicao:
+            self.ativa = False
+            self._condicao.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class FilaLimitada:
+    """Fila de capacidade fixa entre estágios do pipeline, com política de descarte
+
+    descartar_antigo: cheia, remove o item mais velho (vídeo ao vivo);
+    descartar_novo: cheia, recusa o item que chega;
+    bloquear: espera espaço até o tempo limite (itens que não podem se perder).
+    """
+
+    POLITICAS = ('descartar_antigo', 'descartar_novo', 'bloquear')
+
+    def __init__(self, capacidade=2, politica='descartar_antigo'):
+        if politica not in self.POLITICAS:
+            raise ValueError(f"Política de descarte desconhecida: {politica}")
+        self.capacidade = capacidade
+        self.politica = politica
+        self.fechada = False
+        self.descartados = 0
+        self._itens = deque()
+        self._condicao = threading.Condition()
+
+    def __len__(self):
+        # Lido por outras threads (estatísticas dos estágios)
+        with self._condicao:
+            return len(self._itens)
+
+    def _subfila(self, item):
+        """Deque onde o item entra (e cuja capacidade é verificada)"""
+        return self._itens
+
+    def _pendente(self):
+        return bool(self._itens)
+
+    def _proximo(self):
+        return self._itens.popleft()
+
+    def colocar(self, item, tempo_limite=1.0):
+        """Enfileira o item; retorna False se ele foi descartado"""
+        with self._condicao:
+            itens = self._subfila(item)
+            if len(itens) >= self.capacidade:
+                if self.politica == 'descartar_antigo':
+                    itens.popleft()
+                    self.descartados += 1
+                elif self.politica == 'descartar_novo':
+                    self.descartados += 1
+                    return False
+                elif not self._condicao.wait_for(lambda: len(itens) < self.capacidade or self.fechada,
+                                                 tempo_limite) or self.fechada:
+                    self.descartados += 1
+                    return False
+            itens.append(item)
+            self._condicao.notify_all()
+            return True
+
+    def retirar(self, tempo_limite=0.5):
+        """Próximo item, ou None se a fila continuar vazia ou for fechada"""
+        with self._condicao:
+            self._condicao.wait_for(lambda: self._pendente() or self.fechada, tempo_limite)
+            if not self._pendente():
+                return None
+            item = self._proximo()
+            self._condicao.notify_all()
+            return item
+
+    def fechar(self):
+        with self._condicao:
+            self.fechada = True
+            self._condicao.notify_all()
+
+
+class FilaJusta(FilaLimitada):
+    """Fila compartilhada com uma subfila limitada por origem, atendidas em rodízio
+
+    Usada pelo pool de reconhecimento com várias câmeras: uma câmera com
+    muitas faces só descarta os próprios quadros antigos e não impede que
+    as demais sejam atendidas. A capacidade vale para cada subfila.
+    """
+
+    def __init__(self, capacidade=2, politica='descartar_antigo', origem=lambda item: item['camera']):
+        super().__init__(capacidade, politica)
+        self.origem = origem
+        self._subfilas = {}
+        self._ordem = deque()
+
+    def __len__(self):
+        # Uma câmera nova pode criar sua subfila durante a contagem
+        with self._condicao:
+            return sum(len(itens) for itens in self._subfilas.values())
+
+    def _subfila(self, item):
+        chave = self.origem(item)
+        if chave not in self._subfilas:
+            self._subfilas[chave] = deque()
+            self._ordem.append(chave)
+        return self._subfilas[chave]
+
+    def _pendente(self):
+        return any(self._subfilas.values())
+
+    def _proximo(self):
+        # Rodízio: a origem atendida vai para o fim da vez
+        for _ in range(len(self._ordem)):
+            chave = self._ordem[0]
+            self._ordem.rotate(-1)
+            if self._subfilas[chave]:
+                return self._subfilas[chave].popleft()
+
+
+class DetectorMovimento:
+    """Portão de movimento: diferença contra um fundo em média móvel, em resolução reduzida
+
+    `analisar` devolve a região com movimento (em coordenadas do quadro,
+    ampliada por `margem`) ou None quando a cena está parada. Com zonas,
+    movimento fora delas é ignorado. O primeiro quadro, sem fundo ainda,
+    devolve o quadro inteiro.
+    """
+
+    def __init__(self, largura=160, limiar=25, area_minima=0.002, aprendizado=0.05, margem=0.1):
+        self.largura = largura
+        self.limiar = limiar
+        # Fração mínima de pixels alterados para considerar movimento
+        self.area_minima = area_minima
+        self.aprendizado = aprendizado
+        self.margem = margem
+        self.fundo = None
+        self.quadros = 0
+        self.ignorados = 0
+        self._nucleo = np.ones((3, 3), dtype=np.uint8)
+        self._mascara_zonas = (None, None)
+        self._trava = threading.Lock()
+
+    def _mascara(self, forma, fator, zonas):
+        """Máscara das zonas na resolução reduzida (refeita só quando as zonas mudam)"""
+        chave = (forma, tuple(zonas))
+        if self._mascara_zonas[0] != chave:
+            mascara = np.zeros(forma, dtype=np.uint8)
+            for x, y, w, h in zonas:
+                mascara[int(y / fator):int(np.ceil((y + h) / fator)), int(x / fator):int(np.ceil((x + w) / fator))] = 1
+            self._mascara_zonas = (chave, mascara)
+        return self._mascara_zonas[1]
+
+    def analisar(self, gray, zonas=None):
+        altura, largura = gray.shape[:2]
+        fator = largura / float(self.largura)
+        pequena = cv2.resize(gray, (self.largura, max(1, int(round(altura / fator)))), interpolation=cv2.INTER_AREA)
+        pequena = cv2.GaussianBlur(pequena, (5, 5), 0)
+
+        with self._trava:
+            self.quadros += 1
+            if self.fundo is None or self.fundo.shape != pequena.shape:
+                self.fundo = pequena.astype(np.float32)
+                return 0, 0, largura, altura
+
+            diferenca = cv2.absdiff(pequena, cv2.convertScaleAbs(self.fundo))
+            cv2.accumulateWeighted(pequena, self.fundo, self.aprendizado)
+
+        mascara = (diferenca > self.limiar).astype(np.uint8)
+        if zonas:
+            mascara &= self._mascara(mascara.shape, fator, zonas)
+        # Abertura morfológica remove ruído de pixel isolado do sensor
+        mascara = cv2.morphologyEx(mascara, cv2.MORPH_OPEN, self._nucleo)
+        if mascara.mean() < self.area_minima:
+            with self._trava:
+                self.ignorados += 1
+            return None
+
+        ys, xs = np.nonzero(mascara)
+        dx, dy = int(largura * self.margem), int(altura * self.margem)
+        x0 = max(0, int(xs.min() * fator) - dx)
+        y0 = max(0, int(ys.min() * fator) - dy)
+        x1 = min(largura, int((xs.max() + 1) * fator) + dx)
+        y1 = min(altura, int((ys.max() + 1) * fator) + dy)
+        return x0, y0, x1 - x0, y1 - y0
+
+    def taxa_acerto(self):
+        """Fração dos quadros em que o portão evitou a detecção"""
+        with self._trava:
+            return self.ignorados / self.quadros if self.quadros else 0.0
+
+
+class CadenciaDeteccao:
+    """Decide em quais quadros roda a detecção completa; nos demais as faces são seguidas por busca local
+
+    O intervalo N entre detecções completas cresce quando a detecção não cabe
+    na fração do intervalo entre quadros reservada a ela, e volta a 1 quando,
+    com muitas faces, seguir cada uma custa tanto quanto detectar o quadro todo.
+    """
+
+    def __init__(self, maximo=8, fracao_orcamento=0.25, suavizacao=0.2):
+        self.maximo = max(1, int(maximo))
+        self.fracao_orcamento = fracao_orcamento
+        self.suavizacao = suavizacao
+        self.intervalo = 1
+        # Custos medidos (média móvel exponencial): quadro completo e busca local por face
+        self.custo_completa_ms = None
+        self.custo_local_ms = None
+        self.ultima_completa = None
+        self.completas = 0
+        self.locais = 0
+        self._trava = threading.Lock()
+
+    def _media(self, atual, amostra):
+        return amostra if atual is None else atual + self.suavizacao * (amostra - atual)
+
+    def deve_detectar(self, numero):
+        with self._trava:
+            return self.ultima_completa is None or numero - self.ultima_completa >= self.intervalo
+
+    def registrar_completa(self, numero, custo_ms, intervalo_quadros_ms, faces):
+        with self._trava:
+            self.ultima_completa = numero if self.ultima_completa is None else max(self.ultima_completa, numero)
+            self.completas += 1
+            self.custo_completa_ms = self._media(self.custo_completa_ms, custo_ms)
+
+            orcamento = max(self.fracao_orcamento * intervalo_quadros_ms, 1e-3)
+            intervalo = int(np.ceil(self.custo_completa_ms / orcamento))
+            if faces and self.custo_local_ms is not None and \
+                    faces * self.custo_local_ms >= self.custo_completa_ms:
+                intervalo = 1
+            self.intervalo = max(1, min(self.maximo, intervalo))
+
+    def registrar_local(self, custo_ms, faces):
+        with self._trava:
+            self.locais += 1
+            if faces:
+                self.custo_local_ms = self._media(self.custo_local_ms, custo_ms / faces)
+
+    def proporcao_completas(self):
+        with self._trava:
+            total = self.completas + self.locais
+            return self.completas / total if total else 0.0
+
+
+class TrilhaFace:
+    """Face acompanhada entre quadros, com votação da identidade"""
+
+    def __init__(self, id_trilha, caixa, numero):
+        self.id = id_trilha
+        self.caixa = tuple(int(v) for v in caixa)
+        self.ultimo_quadro = numero
+        self.ultima_solicitacao = None
+        # user_id -> [votos, soma das confianças]
+        self.votos = {}
+        self.contada = False
+        self.alertada = False
+
+    def votar(self, user_id, confianca):
+        votos = self.votos.setdefault(user_id, [0, 0.0])
+        votos[0] += 1
+        votos[1] += confianca
+
+    def identidade(self):
+        """(user_id, confiança média) mais votado, ou None se ainda não reconhecida"""
+        if not self.votos:
+            return None
+        user_id, (quantidade, soma) = max(self.votos.items(), key=lambda item: item[1][0])
+        return user_id, soma / quantidade
+
+
+class RastreadorFaces:
+    """Associa as detecções de quadros seguidos a trilhas estáveis (IoU, com centróide de reserva)
+
+    O reconhecimento roda só para trilhas novas e depois a cada
+    `reverificar_a_cada` quadros; a identidade exibida é a mais votada.
+    """
+
+    def __init__(self, limite_iou=0.3, distancia_centroide=0.5, max_perdidos=10, reverificar_a_cada=15,
+                 reenvio=3):
+        self.limite_iou = limite_iou
+        # Distância máxima entre centróides, em frações do lado da caixa
+        self.distancia_centroide = distancia_centroide
+        self.max_perdidos = max_perdidos
+        self.reverificar_a_cada = reverificar_a_cada
+        # Quadros até pedir de novo um reconhecimento que não voltou (quadro descartado)
+        self.reenvio = reenvio
+        self.trilhas = []
+        self.proximo_id = 1
+        self.ultimo_numero = None
+        self._trava = threading.Lock()
+
+    def trilhas_recentes(self):
+        """Trilhas vistas no último quadro processado (as que a busca local deve seguir)"""
+        with self._trava:
+            return [trilha for trilha in self.trilhas if trilha.ultimo_quadro == self.ultimo_numero]
+
+    def atualizar(self, caixas, numero):
+        """Associa as caixas do quadro às trilhas e retorna a trilha de cada caixa"""
+        with self._trava:
+            atribuicao = {}
+            livres = set(range(len(self.trilhas)))
+
+            pares = sorted(((iou(trilha.caixa, caixa), t, c) for t, trilha in enumerate(self.trilhas)
+                            for c, caixa in enumerate(caixas)), reverse=True)
+            for sobreposicao, t, c in pares:
+                if sobreposicao < self.limite_iou:
+                    break
+                if t in livres and c not in atribuicao:
+                    atribuicao[c] = t
+                    livres.discard(t)
+
+            # Movimento rápido sem sobreposição: associa pelo centróide mais próximo
+            for c, (x, y, w, h) in enumerate(caixas):
+                if c in atribuicao:
+                    continue
+                melhor, melhor_distancia = None, None
+                for t in livres:
+                    tx, ty, tw, th = self.trilhas[t].caixa
+                    distancia = np.hypot((x + w / 2) - (tx + tw / 2), (y + h / 2) - (ty + th / 2))
+                    if distancia <= self.distancia_centroide * max(tw, th) and \
+                            (melhor_distancia is None or distancia < melhor_distancia):
+                        melhor, melhor_distancia = t, distancia
+                if melhor is not None:
+                    atribuicao[c] = melhor
+                    livres.discard(melhor)
+
+            resultado = []
+            for c, caixa in enumerate(caixas):
+                if c in atribuicao:
+                    trilha = self.trilhas[atribuicao[c]]
+                    trilha.caixa = tuple(int(v) for v in caixa)
+                    trilha.ultimo_quadro = numero
+                else:
+                    trilha = TrilhaFace(self.proximo_id, caixa, numero)
+                    self.proximo_id += 1
+                    self.trilhas.append(trilha)
+                resultado.append(trilha)
+
+            self.trilhas = [trilha for trilha in self.trilhas if numero - trilha.ultimo_quadro <= self.max_perdidos]
+            self.ultimo_numero = numero if self.ultimo_numero is None else max(self.ultimo_numero, numero)
+            return resultado
+
+    def precisa_reconhecer(self, trilha, numero):
+        """Indica (e registra) se a trilha deve ser reconhecida neste quadro"""
+        with self._trava:
+            if trilha.ultima_solicitacao is None:
+                devido = True
+            elif not trilha.votos:
+                devido = numero - trilha.ultima_solicitacao >= self.reenvio
+            else:
+                devido = numero - trilha.ultima_solicitacao >= self.reverificar_a_cada
+            if devido:
+                trilha.ultima_solicitacao = numero
+            return devido
+
+    def registrar(self, trilha, user_id, confianca):
+        with self._trava:
+            trilha.votar(user_id, confianca)
+
+
+class MonitorCamera:
+    """Câmera monitorada: captura, rastreador, cadência e portão de movimento próprios, estatísticas e cooldown"""
+
+    def __init__(self, camera, reverificar_a_cada=15, cadencia_maxima=8, portao_movimento=True):
+        self.indice = camera['index']
+        self.nome = camera['name']
+        self.captura = CapturaCamera(self.indice)
+        self.rastreador = RastreadorFaces(reverificar_a_cada=reverificar_a_cada)
+        self.cadencia = CadenciaDeteccao(maximo=cadencia_maxima)
+        self.movimento = DetectorMovimento() if portao_movimento else None
+        # Zonas de detecção em frações do quadro, como o usuário desenhou; vazio = quadro inteiro
+        self.zonas = [tuple(zona) for zona in camera.get('zonas', [])]
+        self.thread = None
+        self.estatisticas = {'reconhecimentos': 0, 'desconhecidos': 0, 'alertas': 0}
+        self.ultimo_alarme = {}
+        self.fps_processamento = MedidorFPS()
+        self.ultimo_renderizado = 0
+
+
+class CaixaQuadro:
+    """Caixa de um só lugar entre o pipeline de vídeo e a thread da interface
+
+    Quem produz sempre sobrescreve o quadro guardado; a interface retira o
+    mais recente quando consegue. Quadros sobrescritos sem terem sido
+    exibidos contam como agrupados.
+    """
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._quadro = None
+        self.depositados = 0
+        self.agrupados = 0
+
+    def depositar(self, quadro):
+        with self._trava:
+            if self._quadro is not None:
+                self.agrupados += 1
+            self._quadro = quadro
+            self.depositados += 1
+
+    def retirar(self):
+        """Quadro mais recente (None se nada chegou desde a última retirada)"""
+        with self._trava:
+            quadro, self._quadro = self._quadro, None
+            return quadro
+
+
+class ControladorTaxa:
+    """Ritmo do processamento de vídeo guiado por uma taxa alvo e um orçamento de CPU
+
+    `aguardar` espaça as iterações na taxa do nível atual e, a cada `periodo`
+    segundos, o nível sobe se o uso de CPU passa do orçamento ou se quadros
+    deixam de ser concluídos, e desce com folga. Os primeiros níveis só
+    rareiam o reconhecimento; depois a taxa de quadros (e com ela a
+    detecção) cai até `fps_minimo`.
+    """
+
+    def __init__(self, fps_alvo=15.0, orcamento_cpu=0.75, niveis_reconhecimento=3, fps_minimo=2.0, periodo=1.0):
+        self.fps_alvo = fps_alvo
+        # Fração da CPU total (todos os núcleos) que o processo pode usar
+        self.orcamento_cpu = orcamento_cpu
+        self.niveis_reconhecimento = max(1, niveis_reconhecimento)
+        self.fps_minimo = min(fps_minimo, fps_alvo)
+        self.periodo = periodo
+        self.nivel_maximo = self.niveis_reconhecimento - 1 + \
+            int(np.ceil(np.log(self.fps_minimo / fps_alvo) / np.log(0.75)))
+        self.nivel = 0
+        self.uso_cpu = 0.0
+        self.fps_obtido = MedidorFPS()
+
+        self._proximo = {}
+        self._produzidos = 0
+        self._concluidos = 0
+        self._folgas = 0
+        self._inicio_periodo = time.perf_counter()
+        self._cpu_periodo = time.process_time()
+        self._trava = threading.Lock()
+
+    def passo_reconhecimento(self):
+        """Reconhece 1 a cada N quadros (1, 2, 4... nos níveis iniciais)"""
+        return 2 ** min(self.nivel, self.niveis_reconhecimento - 1)
+
+    def fps_atual(self):
+        reducoes = max(0, self.nivel - (self.niveis_reconhecimento - 1))
+        return max(self.fps_minimo, self.fps_alvo * 0.75 ** reducoes)
+
+    def deve_reconhecer(self, numero):
+        return numero % self.passo_reconhecimento() == 0
+
+    def aguardar(self, chave=None):
+        """Espera o horário do próximo quadro da fonte `chave` (uma por câmera)"""
+        with self._trava:
+            agora = time.perf_counter()
+            proximo = self._proximo.get(chave, agora)
+            # Um atraso não vira rajada: o próximo horário parte de agora
+            self._proximo[chave] = max(proximo, agora) + 1.0 / self.fps_atual()
+            self._produzidos += 1
+        if proximo > agora:
+            time.sleep(proximo - agora)
+        self.avaliar()
+
+    def concluir(self):
+        """Registra um quadro que atravessou todo o processamento"""
+        with self._trava:
+            self._concluidos += 1
+            self.fps_obtido.registrar()
+
+    def avaliar(self):
+        with self._trava:
+            agora = time.perf_counter()
+            decorrido = agora - self._inicio_periodo
+            if decorrido < self.periodo:
+                return
+
+            cpu = time.process_time()
+            self.uso_cpu = (cpu - self._cpu_periodo) / (decorrido * (os.cpu_count() or 1))
+            vazao = self._concluidos / self._produzidos if self._produzidos else 1.0
+
+            if self.uso_cpu > self.orcamento_cpu or vazao < 0.9:
+                self.nivel = min(self.nivel_maximo, self.nivel + 1)
+                self._folgas = 0
+            elif self.uso_cpu < 0.7 * self.orcamento_cpu and vazao >= 0.97:
+                # Só alivia depois de dois períodos seguidos com folga, para não oscilar
+                self._folgas += 1
+                if self._folgas >= 2 and self.nivel > 0:
+                    self.nivel -= 1
+                    self._folgas = 0
+            else:
+                self._folgas = 0
+
+            self._inicio_periodo, self._cpu_periodo = agora, cpu
+            self._produzidos = self._concluidos = 0
+
+    def estado(self):
+        with self._trava:
+            return {'fps_obtido': self.fps_obtido.fps(), 'fps_alvo': self.fps_atual(), 'nivel': self.nivel,
+                    'passo_reconhecimento': self.passo_reconhecimento(), 'uso_cpu': self.uso_cpu}
+
+
+class EstagioPipeline:
+    """Estágio do pipeline de vídeo com workers próprios
+
+    Cada worker retira um item da entrada, aplica `funcao` e entrega o
+    resultado (se não for None) na saída. Mede latência e erros.
+    """
+
+    def __init__(self, nome, funcao, entrada, saida=None, trabalhadores=1, ao_erro=None):
+        self.nome = nome
+        self.funcao = funcao
+        self.entrada = entrada
+        self.saida = saida
+        self.trabalhadores = trabalhadores
+        self.ao_erro = ao_erro
+        self.ativo = False
+        self.threads = []
+
+        self._trava = threading.Lock()
+        self.processados = 0
+        self.erros = 0
+        # Latência média por item (média móvel exponencial)
+        self.latencia_ms = 0.0
+
+    def iniciar(self):
+        self.ativo = True
+        self.threads = [threading.Thread(target=self._executar, name=f"{self.nome}-{i}", daemon=True)
+                        for i in range(self.trabalhadores)]
+        for thread in self.threads:
+            thread.start()
+
+    def _executar(self):
+        while self.ativo:
+            item = self.entrada.retirar()
+            if item is None:
+                if self.entrada.fechada:
+                    break
+                continue
+
+            inicio = time.perf_counter()
+            try:
+                resultado = self.funcao(item)
+            except Exception as e:
+                with self._trava:
+                    self.erros += 1
+                    primeiro = self.erros == 1
+                if primeiro and self.ao_erro is not None:
+                    self.ao_erro(self.nome, e)
+                continue
+
+            with self._trava:
+                self.processados += 1
+                peso = 1.0 if self.processados == 1 else 0.05
+                self.latencia_ms += peso * ((time.perf_counter() - inicio) * 1000 - self.latencia_ms)
+
+            if self.saida is not None and resultado is not None:
+                self.saida.colocar(resultado)
+
+    def estatisticas(self):
+        return {
+            'fila': len(self.entrada),
+            'latencia_ms': self.latencia_ms,
+            'processados': self.processados,
+            'descartados': self.entrada.descartados,
+            'erros': self.erros
+        }
+
+    def parar(self):
+        self.ativo = False
+        self.entrada.fechar()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2.0)
+
+
+class SondadorCameras:
+    """Descoberta de câmeras em paralelo, com tempo limite e cache em disco
+
+    Cada dispositivo é aberto na sua própria thread; os que não respondem
+    dentro do prazo são descartados. O cache guarda resoluções suportadas
+    e FPS medido, para que as próximas inicializações só revalidem as
+    câmeras conhecidas, além das zonas de detecção configuradas.
+    """
+
+    RESOLUCOES_TESTE = [(640, 480), (1280, 720), (1920, 1080)]
+
+    def __init__(self, caminho_cache="cameras_cache.json", indices=range(5), tempo_limite=4.0,
+                 quadros_fps=10):
+        self.caminho_cache = caminho_cache
+        self.indices = list(indices)
+        self.tempo_limite = tempo_limite
+        self.quadros_fps = quadros_fps
+        self.sem_resposta = []
+
+    def _sondar(self, indice, medir):
+        """Abre o dispositivo e, se pedido, mede resoluções e FPS (None se indisponível)"""
+        cap = cv2.VideoCapture(indice)
+        try:
+            if not cap.isOpened():
+                return None
+            ret, _ = cap.read()
+            if not ret:
+                return None
+
+            camera = {'index': indice, 'resolucoes': [], 'fps': None}
+            if medir:
+                for largura, altura in self.RESOLUCOES_TESTE:
+                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, largura)
+                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, altura)
+                    obtida = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+                    if obtida == (largura, altura):
+                        camera['resolucoes'].append([largura, altura])
+
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+                inicio = time.perf_counter()
+                lidos = sum(1 for _ in range(self.quadros_fps) if cap.read()[0])
+                decorrido = time.perf_counter() - inicio
+                if lidos and decorrido > 0:
+                    camera['fps'] = round(lidos / decorrido, 1)
+            return camera
+        except Exception:
+            return None
+        finally:
+            cap.release()
+
+    def _sondar_em_paralelo(self, indices, medir):
+        """Sonda os índices ao mesmo tempo, respeitando o tempo limite total"""
+        resultados = {}
+
+        def sondar(indice):
+            resultados[indice] = self._sondar(indice, medir)
+
+        # Threads daemon: um dispositivo travado não segura o encerramento do programa
+        threads = {indice: threading.Thread(target=sondar, args=(indice,), daemon=True) for indice in indices}
+        for thread in threads.values():
+            thread.start()
+
+        prazo = time.perf_counter() + self.tempo_limite
+        for thread in threads.values():
+            thread.join(max(0.0, prazo - time.perf_counter()))
+
+        self.sem_resposta = [indice for indice, thread in threads.items() if thread.is_alive()]
+        return [resultados[indice] for indice in indices
+                if indice not in self.sem_resposta and resultados.get(indice) is not None]
+
+    def carregar_cache(self):
+        try:
+            with open(self.caminho_cache, 'r', encoding='utf-8') as f:
+                return json.load(f)['cameras']
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def salvar_cache(self, cameras):
+        temporario = f"{self.caminho_cache}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({'versao': 1, 'atualizado': datetime.now().isoformat(timespec='seconds'),
+                       'cameras': cameras}, f, indent=2)
+        os.replace(temporario, self.caminho_cache)
+
+    def detectar(self, completa=False):
+        """Lista de câmeras disponíveis; usa o cache a menos que `completa` seja pedido
+
+        Retorna (câmeras, True se veio do cache revalidado).
+        """
+        conhecidas = {camera['index']: camera for camera in self.carregar_cache()} if not completa else {}
+        if conhecidas:
+            # Só confirma que as câmeras conhecidas ainda respondem; os dados medidos vêm do cache
+            validas = self._sondar_em_paralelo(sorted(conhecidas), medir=False)
+            if validas:
+                return [conhecidas[camera['index']] for camera in validas], True
+
+        cameras = self._sondar_em_paralelo(self.indices, medir=True)
+        # Zonas são configuração do usuário: sobrevivem a uma nova varredura
+        zonas = {camera['index']: camera['zonas'] for camera in self.carregar_cache() if camera.get('zonas')}
+        for camera in cameras:
+            if camera['index'] in zonas:
+                camera['zonas'] = zonas[camera['index']]
+        try:
+            self.salvar_cache(cameras)
+        except OSError:
+            pass
+        return cameras, False
+
+    def salvar_zonas(self, indice, zonas):
+        """Grava as zonas de detecção da câmera no cache"""
+        cameras = self.carregar_cache()
+        for camera in cameras:
+            if camera['index'] == indice:
+                camera['zonas'] = zonas
+                break
+        else:
+            cameras.append({'index': indice, 'resolucoes': [], 'fps': None, 'zonas': zonas})
+        self.salvar_cache(cameras)
+
+
+class GeracaoModelo:
+    """Versão publicada do modelo e quantos quadros a estão usando"""
+
+    def __init__(self, numero, motor):
+        self.numero = numero
+        self.motor = motor
+        self.referencias = 0
+        self.aposentada = False
+
+
+class RegistroModelos:
+    """Gerações versionadas do modelo com troca atômica
+
+    Cada quadro adquire a geração atual e a usa do começo ao fim, então
+    nunca enxerga um modelo pela metade. Uma geração substituída é liberada
+    (motor e arquivo mapeado) assim que o último quadro a devolve.
+    """
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._atual = GeracaoModelo(0, None)
+        self.liberadas = 0
+
+    def atual(self):
+        """Motor da geração atual (None se não houver modelo)"""
+        return self._atual.motor
+
+    def geracao(self):
+        return self._atual.numero
+
+    def publicar(self, motor):
+        """Torna `motor` a geração atual e aposenta a anterior"""
+        with self._trava:
+            anterior = self._atual
+            self._atual = GeracaoModelo(anterior.numero + 1, motor)
+            anterior.aposentada = True
+            if anterior.referencias == 0:
+                self._liberar(anterior)
+            return self._atual.numero
+
+    @contextmanager
+    def adquirir(self):
+        """Empresta o motor da geração atual enquanto o bloco `with` durar"""
+        with self._trava:
+            geracao = self._atual
+            geracao.referencias += 1
+        try:
+            yield geracao.motor
+        finally:
+            with self._trava:
+                geracao.referencias -= 1
+                if geracao.aposentada and geracao.referencias == 0:
+                    self._liberar(geracao)
+
+    def _liberar(self, geracao):
+        # Sem referências ao motor, os arrays (e o mmap do arquivo) são liberados
+        if geracao.motor is not None:
+            self.liberadas += 1
+        geracao.motor = None
+
 
 class SistemaReconhecimento:
     def __init__(self, root):
@@ -145,32 +2471,43 @@ class SistemaReconhecimento:
 
         self.sistema_alarme = SistemaAlarme()
         self.alarme_habilitado = True
-        self.ultimo_alarme = {}  # Cooldown de alarmes por pessoa
 
         self.configurar_variaveis()
 
-        self.verificar_detector()
-
+        # A janela aparece antes; detector, câmeras e modelo carregam em segundo plano
         self.criar_interface()
 
-        self.detectar_cameras_disponiveis()
+        self.iniciar_carregamento()
+
+    @property
+    def recognizer(self):
+        """Motor da geração de modelo publicada (None se não houver)"""
+        return self.modelos.atual()
 
-        self.carregar_modelo()
+    @recognizer.setter
+    def recognizer(self, motor):
+        # Troca atômica: a câmera passa a usar o novo motor a partir do próximo quadro
+        self.modelos.publicar(motor)
 
     def configurar_variaveis(self):
         """Configura todas as variáveis do sistema"""
         self.sistema_ativo = False
         self.modo_cadastro = False
         self.thread_camera = None
-        self.recognizer = None
+        self.modelos = RegistroModelos()
+        # Prontidão dos componentes carregados em segundo plano (badge de status)
+        self.prontidao = {'detector': 'carregando', 'modelo': 'carregando', 'cameras': 'carregando'}
         self.face_cascade = None
         self.nomes = {}
-        self.cam = None
+        self.monitores = []
+        self.detectores_thread = threading.local()
 
         # Configuração da câmera
         self.camera_index = 0
         self.cameras_disponiveis = []
         self.camera_atual = None
+        # Câmeras marcadas para monitoramento simultâneo (índice -> BooleanVar)
+        self.cameras_monitoradas = {}
 
         # Cadastro
         self.dados_cadastro = {
@@ -183,6 +2520,65 @@ class SistemaReconhecimento:
 
         # Configurações de reconhecimento
         self.confidence_threshold = 70
+        self.motor_reconhecimento = MatcherVetorizado.nome
+        # Quantização da galeria nos motores de embeddings (None, 'int8', 'int4')
+        self.quantizacoes = {None: 'Nenhuma (float32)', 'int8': 'int8', 'int4': '4 bits'}
+        self.quantizacao = None
+
+        # Resolução usada pelo detector (fração do quadro); as caixas voltam à resolução total.
+        # Reduzir só pelo ajuste ou pelo benchmark, que escolhe a menor sem perder faces
+        self.escalas_deteccao = {1.0: '100% (resolução total)', 0.75: '75%', 0.5: '50%', 0.33: '33%'}
+        self.escala_deteccao = 1.0
+        # Faces rastreadas são reconhecidas de novo a cada N quadros (identidade por votação)
+        self.rastreio_reverificar = 15
+        # Máximo de quadros entre detecções completas; entre elas as faces são seguidas
+        # por busca local. 1 desliga (detecção completa em todo quadro)
+        self.cadencia_maxima = 8
+        # Pula detecção e reconhecimento com a cena parada e restringe a detecção à região com movimento
+        self.portao_movimento = True
+        # Ritmo do vídeo: taxa alvo de processamento e fração da CPU total que pode ser usada.
+        # Sob carga o reconhecimento é rareado antes da taxa de quadros
+        self.fps_alvo = 15.0
+        self.orcamento_cpu = 0.75
+        # Intervalo mínimo entre fotos salvas no cadastro (poses variadas)
+        self.intervalo_fotos = 0.2
+        self.controle_taxa = None
+        # Prévia do vídeo: o pipeline deposita o quadro e a interface o busca a cada N ms,
+        # colando sempre na mesma PhotoImage
+        self.caixa_video = CaixaQuadro()
+        self.intervalo_previa_ms = 15
+        self.previa_visivel = True
+        self.foto_video = None
+        self._rgb_video = np.empty((480, 640, 3), dtype=np.uint8)
+        # Edição das zonas de detecção no painel de vídeo
+        self.editando_zonas = False
+
+        # Estratégia de busca para galerias grandes
+        self.estrategias_busca = {
+            'exaustiva': 'Exaustiva',
+            IndiceIVF.tipo: 'IVF (ANN)',
+            IndicePrototipos.tipo: 'Protótipos por pessoa'
+        }
+        self.estrategia_busca = IndiceIVF.tipo
+        self.busca_minimo_imagens = 1000
+        # Listas IVF sondadas ou pessoas mantidas no estágio fino
+        self.busca_sondagens = 8
+        self.amostragem_recall = 0.05
+        # Threads usadas para decodificar as fotos do dataset no treinamento
+        self.trabalhadores_carregamento = os.cpu_count() or 1
+        # Estágios do pipeline de vídeo: capacidade da fila de entrada, política de
+        # descarte quando cheia e número de workers. Alertas nunca são descartados em silêncio
+        self.config_pipeline = {
+            'deteccao': {'capacidade': 1, 'politica': 'descartar_antigo', 'trabalhadores': 1},
+            'reconhecimento': {'capacidade': 2, 'politica': 'descartar_antigo', 'trabalhadores': 1},
+            'anotacao': {'capacidade': 2, 'politica': 'descartar_antigo', 'trabalhadores': 1},
+            'render': {'capacidade': 1, 'politica': 'descartar_antigo', 'trabalhadores': 1},
+            'alertas': {'capacidade': 32, 'politica': 'bloquear', 'trabalhadores': 1},
+        }
+        self.estagios = []
+
+        # Treinamento em segundo plano em andamento (TarefaTreinamento)
+        self.tarefa_treinamento = None
 
         # Estatísticas
         self.estatisticas = {
@@ -191,118 +2587,175 @@ class SistemaReconhecimento:
             'alertas': 0
         }
 
-    def detectar_cameras_disponiveis(self):
-        """Detecta todas as câmeras disponíveis no sistema"""
-        self.cameras_disponiveis = []
+    def iniciar_carregamento(self):
+        """Carrega detector, câmeras e modelo em paralelo, sem bloquear a janela"""
+        self.atualizar_prontidao()
+        threading.Thread(target=self.verificar_detector, daemon=True).start()
+        threading.Thread(target=self.carregar_modelo, daemon=True).start()
+        self.detectar_cameras_disponiveis()
 
-        for i in range(5):
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                try:
-                    ret, frame = cap.read()
-                    if ret:
-                        camera_name = f"Câmera {i}"
-                        self.cameras_disponiveis.append({
-                            'index': i,
-                            'name': camera_name
-                        })
-                        self.log(f"✓ Detectada: {camera_name}", self.COR_INFO)
-                except:
-                    pass
-                finally:
-                    cap.release()
+    def marcar_prontidao(self, componente, estado):
+        """Atualiza o estado de um componente (thread da interface)"""
+        self.prontidao[componente] = estado
+        self.atualizar_prontidao()
+
+    def sistema_pronto(self):
+        """Detector carregado e carregamento do modelo concluído"""
+        return self.prontidao['detector'] == 'pronto' and self.prontidao['modelo'] not in ('carregando', 'erro')
+
+    def atualizar_prontidao(self):
+        """Mostra a prontidão no badge de status e libera os botões Iniciar e Cadastrar"""
+        self.label_prontidao.config(
+            text=" | ".join(f"{nome.capitalize()}: {estado}" for nome, estado in self.prontidao.items()),
+            fg=self.COR_SUCESSO if self.sistema_pronto() else self.COR_ALERTA)
+        if not self.sistema_ativo:
+            self.btn_iniciar.config(state=tk.NORMAL if self.sistema_pronto() else tk.DISABLED)
+            self.btn_cadastrar.config(state=tk.NORMAL if self.face_cascade is not None else tk.DISABLED)
+
+    def detectar_cameras_disponiveis(self, completa=False):
+        """Detecta as câmeras disponíveis em segundo plano (completa ignora o cache)"""
+        self.prontidao['cameras'] = 'carregando'
+        self.atualizar_prontidao()
+        threading.Thread(target=self._sondar_cameras, args=(completa,), daemon=True).start()
+
+    def _sondar_cameras(self, completa):
+        """Sonda os dispositivos em paralelo (thread de sondagem)"""
+        sondador = SondadorCameras()
+        inicio = time.perf_counter()
+        cameras, do_cache = sondador.detectar(completa=completa)
+
+        for camera in cameras:
+            detalhes = []
+            if camera['resolucoes']:
+                detalhes.append("x".join(map(str, camera['resolucoes'][-1])))
+            if camera['fps']:
+                detalhes.append(f"{camera['fps']:.0f} fps")
+            camera['name'] = f"Câmera {camera['index']}" + (f" ({', '.join(detalhes)})" if detalhes else "")
+            self.log_da_thread(f"✓ Detectada: {camera['name']}", self.COR_INFO)
+
+        origem = "cache revalidado" if do_cache else "varredura completa"
+        self.log_da_thread(f" Sondagem de câmeras: {origem} em {time.perf_counter() - inicio:.1f}s", self.COR_INFO)
+        if sondador.sem_resposta:
+            self.log_da_thread(f"  ️ Sem resposta no tempo limite: índice(s) {sondador.sem_resposta}",
+                               self.COR_ALERTA)
+
+        self.root.after(0, self._aplicar_cameras, cameras)
+
+    def _aplicar_cameras(self, cameras):
+        """Preenche a lista de câmeras com o resultado da sondagem"""
+        self.cameras_disponiveis = cameras
+
+        # A lista anterior sai sempre, para não sobrar câmera que deixou de existir
+        camera_names = [cam['name'] for cam in self.cameras_disponiveis]
+        self.camera_combo['values'] = camera_names
+        self.menu_monitorar.delete(0, tk.END)
+        self.cameras_monitoradas = {}
+        for cam in self.cameras_disponiveis:
+            self.cameras_monitoradas[cam['index']] = tk.BooleanVar(value=False)
+            self.menu_monitorar.add_checkbutton(label=cam['name'],
+                                                variable=self.cameras_monitoradas[cam['index']])
 
         if not self.cameras_disponiveis:
+            self.camera_combo.set('')
+            self.camera_atual = None
             self.log(" Nenhuma câmera detectada!", self.COR_ERRO)
+            self.marcar_prontidao('cameras', 'nenhuma')
         else:
             self.log(f"✓ {len(self.cameras_disponiveis)} câmera(s) disponível(is)", self.COR_SUCESSO)
-            camera_names = [cam['name'] for cam in self.cameras_disponiveis]
-            self.camera_combo['values'] = camera_names
-            if camera_names:
-                self.camera_combo.current(0)
-                self.camera_atual = self.cameras_disponiveis[0]
+            self.camera_combo.current(0)
+            self.camera_atual = self.cameras_disponiveis[0]
+            self.marcar_prontidao('cameras', str(len(camera_names)))
 
     def verificar_detector(self):
-        """Baixa o detector facial se necessário"""
+        """Baixa o detector facial se necessário e o carrega (thread de carregamento)"""
         if not os.path.exists("haarcascade_frontalface_default.xml"):
             try:
                 url = "https://raw.githubusercontent.com/opencv/opencv/master/data/haarcascades/haarcascade_frontalface_default.xml"
                 urlretrieve(url, "haarcascade_frontalface_default.xml")
-                self.log("✓ Detector facial baixado!", self.COR_SUCESSO)
+                self.log_da_thread("✓ Detector facial baixado!", self.COR_SUCESSO)
             except Exception as e:
-                self.log(f" Erro ao baixar detector: {e}", self.COR_ERRO)
+                self.log_da_thread(f" Erro ao baixar detector: {e}", self.COR_ERRO)
+
+        estado = 'ausente'
+        if os.path.exists('haarcascade_frontalface_default.xml'):
+            cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
+            if not cascade.empty():
+                self.face_cascade = cascade
+                estado = 'pronto'
+                self.log_da_thread("✓ Detector facial carregado", self.COR_SUCESSO)
+        self.root.after(0, self.marcar_prontidao, 'detector', estado)
 
     def carregar_modelo(self):
-        """Carrega o modelo de reconhecimento se existir"""
+        """Carrega nomes e modelo de reconhecimento se existirem (thread de carregamento)"""
+        nomes = None
+        recognizer = None
+        estado = 'não treinado'
         try:
-            if os.path.exists('haarcascade_frontalface_default.xml'):
-                self.face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
-                self.log("✓ Detector facial carregado", self.COR_SUCESSO)
-
             if os.path.exists('trainer/names.pkl'):
                 with open('trainer/names.pkl', 'rb') as f:
-                    self.nomes = pickle.load(f)
-                self.log(f" {len(self.nomes)} pessoa(s) carregada(s)", self.COR_SUCESSO)
-                self.atualizar_lista()
+                    nomes = pickle.load(f)
+                self.log_da_thread(f" {len(nomes)} pessoa(s) carregada(s)", self.COR_SUCESSO)
 
             if os.path.exists('trainer/trainer.yml'):
-                self.recognizer = self.criar_recognizer_simples()
-                self.carregar_dados_modelo()
-                self.log(" Modelo carregado!", self.COR_SUCESSO)
+                try:
+                    recognizer = self.carregar_dados_modelo()
+                    estado = 'pronto'
+                    self.log_da_thread(" Modelo carregado!", self.COR_SUCESSO)
+                except Exception as e:
+                    # Conversão falha ou model_data.bin corrompido: não publica um motor vazio como pronto
+                    estado = 'erro'
+                    self.log_da_thread(f" Erro ao carregar modelo: {e} (treine novamente)", self.COR_ERRO)
             else:
-                self.log(" Nenhum modelo treinado encontrado", self.COR_INFO)
+                self.log_da_thread(" Nenhum modelo treinado encontrado", self.COR_INFO)
 
         except Exception as e:
-            self.log(f" Erro ao carregar sistema: {e}", self.COR_ERRO)
-
-    def criar_recognizer_simples(self):
-        """Cria um reconhecedor facial simples"""
-
-        class SimpleRecognizer:
-            def __init__(self):
-                self.faces_data = []
-                self.labels_data = []
-
-            def train(self, faces, labels):
-                self.faces_data = faces
-                self.labels_data = labels
-                return True
+            estado = 'erro'
+            self.log_da_thread(f" Erro ao carregar sistema: {e}", self.COR_ERRO)
 
-            def predict(self, face):
-                if len(self.faces_data) == 0:
-                    return -1, 100
+        self.root.after(0, self._modelo_carregado, nomes, recognizer, estado)
 
-                face_resized = cv2.resize(face, (100, 100))
-                face_resized = cv2.equalizeHist(face_resized)
-
-                min_distance = 1000
-                best_label = -1
-
-                for i, trained_face in enumerate(self.faces_data):
-                    trained_resized = cv2.resize(trained_face, (100, 100))
-                    trained_resized = cv2.equalizeHist(trained_resized)
-                    diff = cv2.absdiff(face_resized, trained_resized)
-                    distance = np.mean(diff)
-
-                    if distance < min_distance:
-                        min_distance = distance
-                        best_label = self.labels_data[i]
-
-                confidence = min(min_distance / 5, 100)
-                return best_label, confidence
+    def _modelo_carregado(self, nomes, recognizer, estado):
+        """Publica nomes e modelo carregados em segundo plano"""
+        if nomes is not None:
+            self.nomes = nomes
+            self.atualizar_lista()
+        if recognizer is not None:
+            self.recognizer = recognizer
+            self.motor_reconhecimento = recognizer.nome
+            self.motor_var.set(recognizer.descricao)
+        self.marcar_prontidao('modelo', estado)
 
-        return SimpleRecognizer()
+    def criar_recognizer_simples(self):
+        """Cria o reconhecedor facial do motor selecionado"""
+        parametros = {}
+        motor = MOTORES_RECONHECIMENTO.get(self.motor_reconhecimento, MatcherVetorizado)
+        if motor.suporta_quantizacao and self.quantizacao:
+            parametros['quantizacao'] = self.quantizacao
+        return criar_motor(self.motor_reconhecimento, **parametros)
 
     def carregar_dados_modelo(self):
-        """Carrega dados do modelo treinado"""
-        try:
-            if os.path.exists('trainer/model_data.pkl'):
-                with open('trainer/model_data.pkl', 'rb') as f:
-                    model_data = pickle.load(f)
-                self.recognizer.faces_data = model_data.get('faces', [])
-                self.recognizer.labels_data = model_data.get('labels', [])
-        except:
-            pass
+        """Carrega dados do modelo treinado (mapeado em memória) sem publicá-lo
+
+        Erros de conversão ou leitura sobem para quem chamou.
+        """
+        if not os.path.exists('trainer/model_data.bin') and os.path.exists('trainer/model_data.pkl'):
+            converter_pickle_para_binario('trainer/model_data.pkl', 'trainer/model_data.bin')
+            self.log_da_thread(" Modelo convertido de model_data.pkl para model_data.bin", self.COR_INFO)
+
+        if os.path.exists('trainer/model_data.bin'):
+            # Monta o motor completo antes de publicá-lo como nova geração
+            recognizer = motor_de_estado(carregar_modelo_binario('trainer/model_data.bin'))
+            self.configurar_indice(recognizer)
+            self.log_da_thread(f" Memória da galeria: {recognizer.tamanho_modelo() / (1024 * 1024):.1f} MB",
+                               self.COR_INFO)
+            return recognizer
+        return self.criar_recognizer_simples()
+
+    def configurar_indice(self, recognizer):
+        """Aplica as configurações do índice de busca ao reconhecedor"""
+        if recognizer.indice is not None:
+            recognizer.indice.sondagens = self.busca_sondagens
+            recognizer.amostragem_recall = self.amostragem_recall
 
     def criar_interface(self):
         """Cria a interface gráfica"""
@@ -349,10 +2802,17 @@ class SistemaReconhecimento:
         self.camera_combo.pack(side=tk.LEFT)
         self.camera_combo.bind('<<ComboboxSelected>>', self.selecionar_camera)
 
-        tk.Button(camera_frame, text="", command=self.detectar_cameras_disponiveis,
+        tk.Button(camera_frame, text="", command=lambda: self.detectar_cameras_disponiveis(completa=True),
                   bg=self.COR_INFO, fg="white", font=("Arial", 9),
                   relief=tk.FLAT, cursor="hand2", width=3).pack(side=tk.LEFT, padx=5)
 
+        # Várias câmeras marcadas são monitoradas ao mesmo tempo
+        botao_monitorar = tk.Menubutton(camera_frame, text="Monitorar ▾", bg=self.COR_INFO, fg="white",
+                                        font=("Arial", 9), relief=tk.FLAT, cursor="hand2")
+        self.menu_monitorar = tk.Menu(botao_monitorar, tearoff=0)
+        botao_monitorar.config(menu=self.menu_monitorar)
+        botao_monitorar.pack(side=tk.LEFT)
+
         # Status
         self.label_status = tk.Label(
             status_frame,
@@ -365,6 +2825,15 @@ class SistemaReconhecimento:
         )
         self.label_status.pack()
 
+        self.label_prontidao = tk.Label(
+            status_frame,
+            text="Carregando...",
+            font=("Arial", 8),
+            bg=self.COR_FUNDO,
+            fg=self.COR_ALERTA
+        )
+        self.label_prontidao.pack()
+
     def selecionar_camera(self, event=None):
         """Seleciona câmera"""
         selected_name = self.camera_combo.get()
@@ -405,7 +2874,8 @@ class SistemaReconhecimento:
             (" Iniciar", self.COR_SUCESSO, self.iniciar_sistema),
             (" Parar", self.COR_ERRO, self.parar_sistema),
             (" Cadastrar", self.COR_CADASTRO, self.iniciar_cadastro),
-            (" Importar Fotos", self.COR_IMPORTAR, self.importar_fotos)  # NOVO BOTÃO
+            (" Importar Fotos", self.COR_IMPORTAR, self.importar_fotos),  # NOVO BOTÃO
+            (" Zonas", self.COR_INFO, self.editar_zonas)
         ]
 
         btn_frame = tk.Frame(controles, bg=self.COR_SECUNDARIA)
@@ -430,13 +2900,19 @@ class SistemaReconhecimento:
                 self.btn_parar = btn
                 btn.config(state=tk.DISABLED)
             elif "Iniciar" in texto:
+                # Habilitado quando detector e modelo estiverem prontos
                 self.btn_iniciar = btn
+                btn.config(state=tk.DISABLED)
             elif "Testar" in texto:
                 self.btn_conectar = btn
             elif "Cadastrar" in texto:
+                # Habilitado quando o detector estiver carregado
                 self.btn_cadastrar = btn
+                btn.config(state=tk.DISABLED)
             elif "Importar" in texto:
                 self.btn_importar = btn
+            elif "Zonas" in texto:
+                self.btn_zonas = btn
 
     def testar_camera(self):
         """Testa câmera"""
@@ -471,6 +2947,114 @@ class SistemaReconhecimento:
 
         cap.release()
 
+    def editar_zonas(self):
+        """Liga/desliga a edição das zonas de detecção da câmera selecionada no painel de vídeo"""
+        if self.editando_zonas:
+            self.concluir_zonas()
+            return
+
+        if self.sistema_ativo:
+            messagebox.showwarning("Aviso", "Pare o monitoramento para editar as zonas!")
+            return
+
+        if self.camera_atual is None:
+            messagebox.showwarning("Aviso", "Selecione uma câmera!")
+            return
+
+        cap = cv2.VideoCapture(self.camera_atual['index'])
+        ret, frame = cap.read() if cap.isOpened() else (False, None)
+        cap.release()
+        if not ret:
+            messagebox.showerror("Erro", "Não foi possível capturar imagem!")
+            return
+
+        self.quadro_zonas = cv2.resize(frame, (640, 480))
+        self.zonas_edicao = [tuple(zona) for zona in self.camera_atual.get('zonas', [])]
+        self.inicio_zona = None
+        self.editando_zonas = True
+        self.btn_zonas.config(text=" Concluir Zonas")
+
+        self.label_video.bind('<ButtonPress-1>', self._zona_inicio)
+        self.label_video.bind('<B1-Motion>', self._zona_arrasto)
+        self.label_video.bind('<ButtonRelease-1>', self._zona_fim)
+        self.label_video.bind('<Button-3>', self._zona_remover)
+        self.log(f" Zonas de {self.camera_atual['name']}: arraste para criar, botão direito remove",
+                 self.COR_INFO)
+        self.desenhar_zonas()
+
+    def concluir_zonas(self):
+        """Encerra a edição e grava as zonas junto com as configurações da câmera"""
+        for evento in ('<ButtonPress-1>', '<B1-Motion>', '<ButtonRelease-1>', '<Button-3>'):
+            self.label_video.unbind(evento)
+        self.editando_zonas = False
+        self.btn_zonas.config(text=" Zonas")
+
+        zonas = [[round(v, 4) for v in zona] for zona in self.zonas_edicao]
+        self.camera_atual['zonas'] = zonas
+        try:
+            SondadorCameras().salvar_zonas(self.camera_atual['index'], zonas)
+        except OSError as e:
+            self.log(f" Erro ao salvar zonas: {e}", self.COR_ERRO)
+            return
+        descricao = f"{len(zonas)} zona(s)" if zonas else "quadro inteiro"
+        self.log(f"✓ Detecção em {self.camera_atual['name']}: {descricao}", self.COR_SUCESSO)
+
+    def _ponto_zona(self, event):
+        """Posição do mouse em frações da imagem (centralizada no label)"""
+        altura, largura = self.quadro_zonas.shape[:2]
+        x = (event.x - (self.label_video.winfo_width() - largura) / 2) / largura
+        y = (event.y - (self.label_video.winfo_height() - altura) / 2) / altura
+        return min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+
+    def _retangulo_zona(self, event):
+        (x0, y0), (x1, y1) = self.inicio_zona, self._ponto_zona(event)
+        return min(x0, x1), min(y0, y1), abs(x1 - x0), abs(y1 - y0)
+
+    def _zona_inicio(self, event):
+        self.inicio_zona = self._ponto_zona(event)
+
+    def _zona_arrasto(self, event):
+        if self.inicio_zona is not None:
+            self.desenhar_zonas(self._retangulo_zona(event))
+
+    def _zona_fim(self, event):
+        if self.inicio_zona is None:
+            return
+        zona = self._retangulo_zona(event)
+        self.inicio_zona = None
+        # Ignora cliques sem arrasto
+        if zona[2] > 0.02 and zona[3] > 0.02:
+            self.zonas_edicao.append(zona)
+        self.desenhar_zonas()
+
+    def _zona_remover(self, event):
+        x, y = self._ponto_zona(event)
+        self.zonas_edicao = [zona for zona in self.zonas_edicao
+                             if not (zona[0] <= x <= zona[0] + zona[2] and zona[1] <= y <= zona[1] + zona[3])]
+        self.desenhar_zonas()
+
+    def desenhar_zonas(self, rascunho=None):
+        """Mostra o quadro da câmera com as zonas (e a que está sendo arrastada)"""
+        frame = self.quadro_zonas.copy()
+        altura, largura = frame.shape[:2]
+        regioes = zonas_em_pixels(self.zonas_edicao, largura, altura)
+
+        preenchido = frame.copy()
+        for x, y, w, h in regioes:
+            cv2.rectangle(preenchido, (x, y), (x + w, y + h), (0, 200, 255), -1)
+        frame = cv2.addWeighted(preenchido, 0.3, frame, 0.7, 0)
+        for x, y, w, h in regioes:
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 200, 255), 2)
+        for x, y, w, h in zonas_em_pixels([rascunho] if rascunho else [], largura, altura):
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (255, 255, 255), 1)
+
+        texto = f"{len(regioes)} zona(s)" if regioes else "Sem zonas: detecção no quadro inteiro"
+        cv2.putText(frame, texto, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+        imgtk = ImageTk.PhotoImage(image=Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        self.label_video.imgtk = imgtk
+        self.label_video.configure(image=imgtk, text="")
+
     def criar_coluna_controles(self, parent):
         """Cria coluna de controles"""
         coluna = tk.Frame(parent, bg=self.COR_SECUNDARIA, width=400)
@@ -586,6 +3170,24 @@ class SistemaReconhecimento:
         )
         self.btn_limpar.pack(side=tk.LEFT, padx=5)
 
+        self.btn_cancelar_treinamento = tk.Button(
+            botoes_frame,
+            text="⏹ CANCELAR",
+            command=self.cancelar_treinamento,
+            bg=self.COR_ALERTA,
+            fg="white",
+            font=("Arial", 9, "bold"),
+            relief=tk.FLAT,
+            cursor="hand2",
+            padx=12,
+            pady=8,
+            state=tk.DISABLED
+        )
+        self.btn_cancelar_treinamento.pack(side=tk.LEFT, padx=5)
+
+        self.barra_treinamento = ttk.Progressbar(painel, mode='determinate', maximum=100)
+        self.barra_treinamento.pack(fill=tk.X, padx=15, pady=(0, 5))
+
         self.label_status_treinamento = tk.Label(
             painel,
             text="Pronto para treinar",
@@ -704,11 +3306,157 @@ class SistemaReconhecimento:
         self.slider_sensibilidade.grid(row=0, column=1, padx=5)
         self.slider_sensibilidade.bind("<ButtonRelease>", self.atualizar_sensibilidade)
 
+        tk.Label(config_frame, text="Motor:", bg=self.COR_FUNDO,
+                 fg="white", font=("Arial", 8)).grid(row=1, column=0, padx=5, sticky="w")
+
+        self.motor_var = tk.StringVar(value=MOTORES_RECONHECIMENTO[self.motor_reconhecimento].descricao)
+        self.motor_combo = ttk.Combobox(config_frame, textvariable=self.motor_var, state="readonly",
+                                        values=[motor.descricao for motor in MOTORES_RECONHECIMENTO.values()],
+                                        width=25, font=("Arial", 8))
+        self.motor_combo.grid(row=1, column=1, padx=5, pady=(5, 0))
+        self.motor_combo.bind('<<ComboboxSelected>>', self.selecionar_motor)
+
+        tk.Label(config_frame, text="Quantização:", bg=self.COR_FUNDO,
+                 fg="white", font=("Arial", 8)).grid(row=4, column=0, padx=5, sticky="w")
+
+        self.quantizacao_var = tk.StringVar(value=self.quantizacoes[self.quantizacao])
+        quantizacao_combo = ttk.Combobox(config_frame, textvariable=self.quantizacao_var, state="readonly",
+                                         values=list(self.quantizacoes.values()),
+                                         width=25, font=("Arial", 8))
+        quantizacao_combo.grid(row=4, column=1, padx=5, pady=(5, 0))
+        quantizacao_combo.bind('<<ComboboxSelected>>', self.selecionar_quantizacao)
+
+        tk.Label(config_frame, text="Busca:", bg=self.COR_FUNDO,
+                 fg="white", font=("Arial", 8)).grid(row=2, column=0, padx=5, sticky="w")
+
+        self.busca_var = tk.StringVar(value=self.estrategias_busca[self.estrategia_busca])
+        busca_combo = ttk.Combobox(config_frame, textvariable=self.busca_var, state="readonly",
+                                   values=list(self.estrategias_busca.values()),
+                                   width=25, font=("Arial", 8))
+        busca_combo.grid(row=2, column=1, padx=5, pady=(5, 0))
+        busca_combo.bind('<<ComboboxSelected>>', self.atualizar_busca)
+
+        tk.Label(config_frame, text="Sondagens/top-k:", bg=self.COR_FUNDO,
+                 fg="white", font=("Arial", 8)).grid(row=3, column=0, padx=5, sticky="w")
+
+        self.sondagens_var = tk.IntVar(value=self.busca_sondagens)
+        slider_sondagens = tk.Scale(config_frame, from_=1, to=64, variable=self.sondagens_var,
+                                    orient=tk.HORIZONTAL, length=180,
+                                    bg=self.COR_FUNDO, fg="white", font=("Arial", 8))
+        slider_sondagens.grid(row=3, column=1, padx=5)
+        slider_sondagens.bind("<ButtonRelease>", self.atualizar_busca)
+
+        tk.Label(config_frame, text="Resolução detecção:", bg=self.COR_FUNDO,
+                 fg="white", font=("Arial", 8)).grid(row=5, column=0, padx=5, sticky="w")
+
+        self.escala_deteccao_var = tk.StringVar(value=self.escalas_deteccao[self.escala_deteccao])
+        escala_combo = ttk.Combobox(config_frame, textvariable=self.escala_deteccao_var, state="readonly",
+                                    values=list(self.escalas_deteccao.values()),
+                                    width=25, font=("Arial", 8))
+        escala_combo.grid(row=5, column=1, padx=5, pady=(5, 0))
+        escala_combo.bind('<<ComboboxSelected>>', self.selecionar_escala_deteccao)
+
+        tk.Button(config_frame, text=" Benchmark de detecção", command=self.benchmark_deteccao,
+                  bg=self.COR_INFO, fg="white", font=("Arial", 8), relief=tk.FLAT,
+                  cursor="hand2").grid(row=6, column=0, columnspan=2, pady=(8, 0))
+
     def atualizar_sensibilidade(self, event=None):
         """Atualiza sensibilidade"""
         self.confidence_threshold = self.sensibilidade_var.get()
         self.log(f"⚙ Limite ajustado: {self.confidence_threshold}", self.COR_INFO)
 
+    def atualizar_busca(self, event=None):
+        """Atualiza a estratégia de busca (mais sondagens = mais recall, menos velocidade)"""
+        for tipo, descricao in self.estrategias_busca.items():
+            if descricao == self.busca_var.get():
+                self.estrategia_busca = tipo
+        self.busca_sondagens = self.sondagens_var.get()
+        if self.recognizer is not None:
+            self.configurar_indice(self.recognizer)
+        self.log(f"⚙ Busca: {self.estrategias_busca[self.estrategia_busca]} | "
+                 f"Sondagens/top-k: {self.busca_sondagens}", self.COR_INFO)
+
+    def selecionar_quantizacao(self, event=None):
+        """Seleciona a quantização da galeria usada no próximo treinamento"""
+        for quantizacao, descricao in self.quantizacoes.items():
+            if descricao == self.quantizacao_var.get():
+                self.quantizacao = quantizacao
+                self.log(f"⚙ Quantização: {descricao} (apenas Eigenfaces/Fisherfaces; treine novamente)",
+                         self.COR_INFO)
+                break
+
+    def aplicar_escala_deteccao(self, escala):
+        """Adota a escala escolhida pelo benchmark e atualiza o ajuste na tela"""
+        self.escala_deteccao_var.set(self.escalas_deteccao[escala])
+        self.selecionar_escala_deteccao()
+
+    def selecionar_escala_deteccao(self, event=None):
+        """Seleciona a resolução do detector (vale a partir do próximo quadro)"""
+        for escala, descricao in self.escalas_deteccao.items():
+            if descricao == self.escala_deteccao_var.get():
+                self.escala_deteccao = escala
+                self.log(f"⚙ Resolução de detecção: {descricao}", self.COR_INFO)
+                break
+
+    def benchmark_deteccao(self, quadros=20, recall_minimo=0.95):
+        """Compara tempo de detecção e recall nas escalas disponíveis com quadros da câmera
+
+        Ao final adota a escala mais rápida cujo recall fica em recall_minimo
+        ou acima; sem faces nos quadros a resolução atual é mantida.
+        """
+        if self.sistema_ativo:
+            messagebox.showwarning("Aviso", "Pare o monitoramento antes do benchmark (a câmera está em uso).")
+            return
+        if not self.camera_atual:
+            messagebox.showwarning("Aviso", "Selecione uma câmera!")
+            return
+
+        def executar():
+            cap = cv2.VideoCapture(self.camera_atual['index'])
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            imagens = []
+            try:
+                for _ in range(quadros):
+                    ret, frame = cap.read()
+                    if ret:
+                        imagens.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+            finally:
+                cap.release()
+
+            if not imagens:
+                self.log_da_thread(" Benchmark: nenhum quadro capturado", self.COR_ERRO)
+                return
+
+            cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
+            resultados = benchmark_escalas_deteccao(cascade, imagens, tuple(self.escalas_deteccao))
+            self.log_da_thread(f" Benchmark de detecção ({len(imagens)} quadros):", self.COR_INFO)
+            base = resultados[1.0][0]
+            for escala, (tempo_ms, recall) in resultados.items():
+                texto_recall = f"{recall * 100:.0f}%" if recall is not None else "sem faces"
+                self.log_da_thread(f"   {self.escalas_deteccao[escala]}: {tempo_ms:.1f} ms/quadro "
+                                   f"({base / max(tempo_ms, 1e-9):.1f}x) | recall {texto_recall}", self.COR_INFO)
+
+            aprovadas = [escala for escala, (_, recall) in resultados.items()
+                         if recall is not None and recall >= recall_minimo]
+            if not aprovadas:
+                self.log_da_thread(" Benchmark: nenhuma face nos quadros, resolução mantida", self.COR_ALERTA)
+                return
+            escolhida = min(aprovadas, key=lambda escala: resultados[escala][0])
+            self.root.after(0, self.aplicar_escala_deteccao, escolhida)
+
+        self.log(" Capturando quadros para o benchmark de detecção...", self.COR_INFO)
+        threading.Thread(target=executar, daemon=True).start()
+
+    def selecionar_motor(self, event=None):
+        """Seleciona o motor usado no próximo treinamento"""
+        for motor in MOTORES_RECONHECIMENTO.values():
+            if motor.descricao == self.motor_var.get():
+                self.motor_reconhecimento = motor.nome
+                self.log(f"⚙ Motor selecionado: {motor.descricao} (treine novamente para aplicar)",
+                         self.COR_INFO)
+                break
+
     def criar_area_log(self):
 
         container = tk.Frame(self.root, bg=self.COR_FUNDO)
@@ -1107,6 +3855,10 @@ class SistemaReconhecimento:
             messagebox.showwarning("Aviso", "Pare o sistema antes de cadastrar!")
             return
 
+        if self.face_cascade is None:
+            messagebox.showwarning("Aviso", "Aguarde o carregamento do detector facial!")
+            return
+
         if not self.camera_atual:
             messagebox.showwarning("Aviso", "Selecione uma câmera primeiro!")
             return
@@ -1364,10 +4116,16 @@ class SistemaReconhecimento:
             tempo_inicio = time.time()
             tempo_limite = 60  # 1 minuto para capturar 50 fotos
 
+            # Sem reconhecimento aqui: sob carga só a taxa de quadros cai
+            controle = ControladorTaxa(fps_alvo=self.fps_alvo, orcamento_cpu=self.orcamento_cpu,
+                                       niveis_reconhecimento=1)
+            ultima_foto = 0.0
+
             while (self.cadastro_ativo and
                    self.contador_fotos < self.total_fotos and
                    time.time() - tempo_inicio < tempo_limite):
 
+                controle.aguardar()
                 ret, frame = self.cap_cadastro.read()
                 if not ret:
                     break
@@ -1376,8 +4134,8 @@ class SistemaReconhecimento:
                 gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
                 faces = self.face_cascade.detectMultiScale(gray, 1.3, 5, minSize=(100, 100))
 
-                # Capturar foto quando face for detectada
-                if len(faces) == 1:  # Apenas se houver UMA face
+                # Capturar foto quando face for detectada, espaçando as fotos no tempo
+                if len(faces) == 1 and time.perf_counter() - ultima_foto >= self.intervalo_fotos:
                     (x, y, w, h) = faces[0]
                     face_img = gray[y:y + h, x:x + w]
 
@@ -1390,17 +4148,18 @@ class SistemaReconhecimento:
                         cv2.imwrite(foto_filename, face_img)
                         self.fotos_capturadas.append(face_img)
                         self.contador_fotos += 1
+                        ultima_foto = time.perf_counter()
 
 
                         if janela_cadastro.winfo_exists():
                             janela_cadastro.after(0, lambda: contador_var.set(
                                 f"Fotos capturadas: {self.contador_fotos}/{self.total_fotos}"))
 
-                        # Pequeno delay entre fotos
-                        time.sleep(0.2)
+                controle.concluir()
 
-                # Pequeno delay para não sobrecarregar
-                time.sleep(0.03)
+            ritmo = controle.estado()
+            self.log(f" Ritmo da captura: {ritmo['fps_obtido']:.1f} fps (alvo {ritmo['fps_alvo']:.0f})",
+                     self.COR_INFO)
 
 
             if self.contador_fotos >= self.total_fotos:
@@ -1513,132 +4272,230 @@ class SistemaReconhecimento:
             self.log(f" Erro ao salvar nomes: {e}", self.COR_ERRO)
 
     def treinar_modelo(self):
-        """Treina o modelo de reconhecimento facial"""
-        try:
-            self.label_status_treinamento.config(text=" Buscando dados...", fg=self.COR_INFO)
-            self.btn_treinar.config(state=tk.DISABLED, text=" TREINANDO...")
-            self.root.update()
-
-            dataset_dir = "dataset"
-            if not os.path.exists(dataset_dir):
-                self.log(" Diretório 'dataset' não encontrado!", self.COR_ERRO)
-                self.label_status_treinamento.config(text="❌ Nenhum dado encontrado", fg=self.COR_ERRO)
-                self.btn_treinar.config(state=tk.NORMAL, text=" TREINAR SISTEMA")
-                messagebox.showwarning("Aviso", "Nenhuma pessoa cadastrada ainda!")
-                return
-
-
-            user_dirs = [d for d in os.listdir(dataset_dir) if d.startswith("User_")]
-            if not user_dirs:
-                self.log(" Nenhuma pessoa para treinar!", self.COR_ERRO)
-                self.label_status_treinamento.config(text="❌ Nenhuma pessoa", fg=self.COR_ERRO)
-                self.btn_treinar.config(state=tk.NORMAL, text=" TREINAR SISTEMA")
-                messagebox.showwarning("Aviso", "Nenhuma pessoa cadastrada ainda!")
-                return
-
-            faces = []
-            labels = []
-
-            self.log(f" Encontradas {len(user_dirs)} pessoa(s) para treinar", self.COR_INFO)
-
-
-            for user_dir in user_dirs:
-                try:
-                    user_id = int(user_dir.replace("User_", ""))
-                    user_path = os.path.join(dataset_dir, user_dir)
-
-                    if not os.path.isdir(user_path):
-                        continue
-
-
-                    images = [f for f in os.listdir(user_path) if f.endswith(('.jpg', '.png'))]
-
-                    if len(images) < 10:
-                        self.log(f"  ️ User_{user_id}: Apenas {len(images)} imagens (mínimo recomendado: 10)",
-                                 self.COR_ALERTA)
-                    else:
-                        self.log(f"  User_{user_id}: {len(images)} imagens", self.COR_INFO)
-
-                    for image_name in images:
-                        image_path = os.path.join(user_path, image_name)
-                        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        """Inicia o treinamento do modelo em segundo plano"""
+        if self.tarefa_treinamento is not None and self.tarefa_treinamento.ativa():
+            return
 
-                        if img is not None:
+        dataset_dir = "dataset"
+        if not os.path.exists(dataset_dir):
+            self.log(" Diretório 'dataset' não encontrado!", self.COR_ERRO)
+            self.label_status_treinamento.config(text="❌ Nenhum dado encontrado", fg=self.COR_ERRO)
+            messagebox.showwarning("Aviso", "Nenhuma pessoa cadastrada ainda!")
+            return
 
-                            img_resized = cv2.resize(img, (200, 200))
-                            img_equalized = cv2.equalizeHist(img_resized)
-                            faces.append(img_equalized)
-                            labels.append(user_id)
+        user_dirs = [d for d in os.listdir(dataset_dir) if d.startswith("User_")]
+        if not user_dirs:
+            self.log(" Nenhuma pessoa para treinar!", self.COR_ERRO)
+            self.label_status_treinamento.config(text="❌ Nenhuma pessoa", fg=self.COR_ERRO)
+            messagebox.showwarning("Aviso", "Nenhuma pessoa cadastrada ainda!")
+            return
 
-                except Exception as e:
-                    self.log(f"   Erro em {user_dir}: {e}", self.COR_ERRO)
+        self.log(f" Encontradas {len(user_dirs)} pessoa(s) para treinar", self.COR_INFO)
+        self.btn_treinar.config(state=tk.DISABLED, text=" TREINANDO...")
+        self.btn_cancelar_treinamento.config(state=tk.NORMAL)
+        self.barra_treinamento['value'] = 0
+
+        # O reconhecimento continua com o modelo atual enquanto o novo é treinado
+        tarefa = TarefaTreinamento(
+            lambda progresso: self.root.after(0, self.mostrar_progresso_treinamento, progresso))
+        tarefa.thread = threading.Thread(target=self._executar_treinamento, args=(tarefa, dataset_dir),
+                                         daemon=True)
+        self.tarefa_treinamento = tarefa
+        tarefa.thread.start()
+
+    def cancelar_treinamento(self):
+        """Pede o cancelamento do treinamento em andamento"""
+        if self.tarefa_treinamento is not None and self.tarefa_treinamento.ativa():
+            self.tarefa_treinamento.cancelar()
+            self.btn_cancelar_treinamento.config(state=tk.DISABLED)
+            self.label_status_treinamento.config(text=" Cancelando...", fg=self.COR_ALERTA)
+
+    def mostrar_progresso_treinamento(self, progresso):
+        """Atualiza barra e status do treinamento (thread da interface)"""
+        texto = f" {progresso['etapa']}..."
+        if 'arquivos_total' in progresso:
+            texto = (f" {progresso['etapa']}: {progresso['arquivos_feitos']}/{progresso['arquivos_total']} fotos, "
+                     f"{progresso['pessoas_feitas']}/{progresso['pessoas_total']} pessoas")
+        if progresso['eta'] is not None:
+            texto += f" | ETA {progresso['eta']:.0f}s"
+        if progresso['fracao'] is not None:
+            self.barra_treinamento['value'] = progresso['fracao'] * 100
+        self.label_status_treinamento.config(text=texto, fg=self.COR_ALERTA)
+
+    def log_da_thread(self, mensagem, cor=None):
+        """Registra no log a partir de uma thread de trabalho"""
+        self.root.after(0, self.log, mensagem, cor)
+
+    def _executar_treinamento(self, tarefa, dataset_dir):
+        """Treina e grava o modelo em um arquivo temporário (thread de treinamento)"""
+        trainer_dir = "trainer"
+        temporario = f'{trainer_dir}/model_data.bin.novo'
+        try:
+            # Só fotos novas ou alteradas são decodificadas; o restante vem do cache
+            tarefa.etapa("Atualizando cache do dataset")
+            inicio = time.perf_counter()
+            dados = ManifestoDataset(dataset_dir, trabalhadores=self.trabalhadores_carregamento).atualizar(
+                progresso=tarefa.arquivos, cancelado=tarefa.cancelado)
+            faces = dados['faces']
+            labels = dados['rotulos'].tolist()
+            self.log_da_thread(f" Dataset: {dados['novos']} nova(s)/alterada(s), {dados['removidos']} removida(s), "
+                               f"{len(dados['mantidos'])} em cache ({time.perf_counter() - inicio:.1f}s)",
+                               self.COR_INFO)
+            if dados['imagens_por_segundo']:
+                self.log_da_thread(f" Carregamento paralelo: {dados['imagens_por_segundo']:.0f} imagens/s "
+                                   f"({self.trabalhadores_carregamento} threads)", self.COR_INFO)
+            if dados['invalidos']:
+                self.log_da_thread(f"  ️ {dados['invalidos']} arquivo(s) ilegível(is) ignorado(s)",
+                                   self.COR_ALERTA)
+
+            for user_id, quantidade in zip(*np.unique(dados['rotulos'], return_counts=True)):
+                if quantidade < 10:
+                    self.log_da_thread(f"  ️ User_{user_id}: Apenas {quantidade} imagens "
+                                       f"(mínimo recomendado: 10)", self.COR_ALERTA)
+                else:
+                    self.log_da_thread(f"  User_{user_id}: {quantidade} imagens", self.COR_INFO)
 
             if len(faces) == 0:
-                self.log(" Nenhuma imagem válida encontrada!", self.COR_ERRO)
-                self.label_status_treinamento.config(text=" Nenhuma imagem", fg=self.COR_ERRO)
-                self.btn_treinar.config(state=tk.NORMAL, text=" TREINAR SISTEMA")
-                messagebox.showwarning("Aviso", "Nenhuma imagem válida para treinamento!")
+                self.root.after(0, self._falha_treinamento, " Nenhuma imagem",
+                                "Nenhuma imagem válida para treinamento!")
                 return
 
-            self.log(f" Total: {len(faces)} imagens para treinar", self.COR_INFO)
-
-
-            if self.recognizer is None:
-                self.recognizer = self.criar_recognizer_simples()
+            self.log_da_thread(f" Total: {len(faces)} imagens para treinar", self.COR_INFO)
 
             # Treinar modelo
-            self.label_status_treinamento.config(text=" Treinando modelo...", fg=self.COR_ALERTA)
-            self.root.update()
-
-            success = self.recognizer.train(faces, labels)
-
-            if success:
-
-                trainer_dir = "trainer"
-                if not os.path.exists(trainer_dir):
-                    os.makedirs(trainer_dir)
-
-
-                model_data = {
-                    'faces': faces,
-                    'labels': labels
-                }
+            tarefa.etapa("Treinando modelo")
+            anterior = self.recognizer
+            compativel = (anterior is not None and anterior.suporta_incremental
+                          and anterior.nome == self.motor_reconhecimento)
+            # A galeria só corresponde ao cache anterior se saiu dele: um treinamento cancelado
+            # ou com falha já pode ter avançado o cache sem publicar o modelo
+            if (compativel and dados['geracao_anterior'] is not None
+                    and anterior.geracao_dataset == dados['geracao_anterior']
+                    and np.array_equal(anterior.rotulos, dados['rotulos_anteriores'])):
+                mantidos = len(dados['mantidos'])
+                recognizer = anterior.atualizado(dados['mantidos'], faces[mantidos:], labels[mantidos:])
+                success = True
+                self.log_da_thread(" Galeria atualizada incrementalmente", self.COR_INFO)
+            else:
+                if compativel:
+                    self.log_da_thread(" Modelo publicado não corresponde ao cache do dataset: "
+                                       "treinamento completo", self.COR_ALERTA)
+                recognizer = self.criar_recognizer_simples()
+                success = recognizer.train(faces, labels)
+            recognizer.geracao_dataset = dados['geracao']
+
+            if not success:
+                self.root.after(0, self._falha_treinamento, " Falha no treinamento",
+                                "Falha ao treinar modelo!")
+                return
 
-                with open(f'{trainer_dir}/model_data.pkl', 'wb') as f:
-                    pickle.dump(model_data, f)
+            if (recognizer.aceita_indice and self.estrategia_busca in INDICES_BUSCA
+                    and len(faces) >= self.busca_minimo_imagens):
+                tarefa.etapa("Construindo índice de busca")
+                recognizer.construir_indice(self.estrategia_busca, sondagens=self.busca_sondagens)
+                self.configurar_indice(recognizer)
+                self.log_da_thread(f" Busca: {self.estrategias_busca[self.estrategia_busca]} | "
+                                   f"{len(recognizer.indice.centroides)} centróides, "
+                                   f"sondagens/top-k: {self.busca_sondagens}", self.COR_INFO)
+
+            tarefa.etapa("Medindo desempenho")
+            resumo = {
+                'imagens': len(faces),
+                'pessoas': len(set(labels)),
+                'tamanho_kb': recognizer.tamanho_modelo() / 1024,
+                'latencia': recognizer.medir_latencia(faces),
+                'recall': None
+            }
+            if recognizer.busca_aproximada():
+                resumo['recall'], resumo['aceleracao'] = recognizer.avaliar_recall(gerar_consultas_benchmark(faces))
+
+            # O modelo publicado só é substituído quando tudo terminou sem cancelamento
+            tarefa.etapa("Salvando modelo")
+            os.makedirs(trainer_dir, exist_ok=True)
+            salvar_modelo_binario(recognizer.exportar_estado(), temporario)
+            tarefa.verificar()
+            self.root.after(0, self._publicar_treinamento, tarefa, recognizer, temporario, resumo)
+
+        except TreinamentoCancelado:
+            self.root.after(0, self._cancelamento_concluido)
+        except Exception as e:
+            self.root.after(0, self._falha_treinamento, " Erro no treinamento", f"Erro no treinamento: {str(e)}")
+        finally:
+            if tarefa.cancelado.is_set() and os.path.exists(temporario):
+                os.remove(temporario)
+
+    def _publicar_treinamento(self, tarefa, recognizer, temporario, resumo):
+        """Publica o modelo treinado e troca o reconhecedor (thread da interface)"""
+        if tarefa.cancelado.is_set():
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            self._cancelamento_concluido()
+            return
 
-                # Criar arquivo YML para compatibilidade
-                with open(f'{trainer_dir}/trainer.yml', 'w') as f:
-                    f.write("# Modelo treinado\n")
+        # Troca a geração em memória primeiro: a câmera não precisa parar
+        self.recognizer = recognizer
+        self._gravar_modelo_publicado(temporario)
+        self.marcar_prontidao('modelo', 'pronto')
+        self._finalizar_treinamento(" Modelo treinado!", self.COR_SUCESSO)
+        self.log(f" Geração {self.modelos.geracao()} do modelo publicada", self.COR_INFO)
+
+        self.log(f" Modelo treinado com {resumo['imagens']} imagens de {resumo['pessoas']} pessoa(s) "
+                 f"em {time.perf_counter() - tarefa.inicio:.1f}s!", self.COR_SUCESSO)
+        self.log(f" Motor: {recognizer.descricao} | Modelo: {resumo['tamanho_kb']:.0f} KB | "
+                 f"Latência: {resumo['latencia']:.2f} ms/consulta", self.COR_INFO)
+        if resumo['recall'] is not None:
+            self.log(f" Benchmark da busca aproximada: {resumo['recall'] * 100:.1f}% de acerto vs. busca exata, "
+                     f"{resumo['aceleracao']:.1f}x mais rápida", self.COR_INFO)
+
+        # Mostrar mensagem de sucesso
+        messagebox.showinfo(
+            " Treinamento Concluído",
+            f" MODELO TREINADO COM SUCESSO!\n\n"
+            f" Estatísticas:\n"
+            f"• Pessoas: {resumo['pessoas']}\n"
+            f"• Imagens: {resumo['imagens']}\n"
+            f"• Média por pessoa: {resumo['imagens'] // resumo['pessoas'] if resumo['pessoas'] else 0}\n"
+            f"• Motor: {recognizer.descricao}\n"
+            f"• Tamanho do modelo: {resumo['tamanho_kb']:.0f} KB\n"
+            f"• Latência por consulta: {resumo['latencia']:.2f} ms\n\n"
+            f" O sistema está pronto para reconhecimento!"
+        )
 
-                self.label_status_treinamento.config(text=" Modelo treinado!", fg=self.COR_SUCESSO)
-                self.btn_treinar.config(state=tk.NORMAL, text=" TREINAR SISTEMA")
+    def _gravar_modelo_publicado(self, temporario, tentativas=25):
+        """Substitui trainer/model_data.bin pelo modelo publicado
 
-                self.log(f" Modelo treinado com {len(faces)} imagens de {len(set(labels))} pessoa(s)!",
-                         self.COR_SUCESSO)
+        No Windows o arquivo não pode ser substituído enquanto a geração
+        anterior ainda o mapeia; nesse caso tenta de novo em seguida.
+        """
+        try:
+            os.replace(temporario, 'trainer/model_data.bin')
+            # Criar arquivo YML para compatibilidade
+            with open('trainer/trainer.yml', 'w') as f:
+                f.write("# Modelo treinado\n")
+        except PermissionError:
+            if tentativas > 0:
+                self.root.after(200, self._gravar_modelo_publicado, temporario, tentativas - 1)
+            else:
+                self.log(" Não foi possível gravar trainer/model_data.bin (arquivo em uso)", self.COR_ERRO)
+        except Exception as e:
+            self.log(f" Erro ao salvar modelo: {e}", self.COR_ERRO)
 
-                # Mostrar mensagem de sucesso
-                messagebox.showinfo(
-                    " Treinamento Concluído",
-                    f" MODELO TREINADO COM SUCESSO!\n\n"
-                    f" Estatísticas:\n"
-                    f"• Pessoas: {len(set(labels))}\n"
-                    f"• Imagens: {len(faces)}\n"
-                    f"• Média por pessoa: {len(faces) // len(set(labels)) if set(labels) else 0}\n\n"
-                    f" O sistema está pronto para reconhecimento!"
-                )
+    def _finalizar_treinamento(self, status, cor):
+        """Restaura os controles ao fim do treinamento (thread da interface)"""
+        self.tarefa_treinamento = None
+        self.btn_treinar.config(state=tk.NORMAL, text=" TREINAR SISTEMA")
+        self.btn_cancelar_treinamento.config(state=tk.DISABLED)
+        self.barra_treinamento['value'] = 0
+        self.label_status_treinamento.config(text=status, fg=cor)
 
-            else:
-                self.label_status_treinamento.config(text=" Falha no treinamento", fg=self.COR_ERRO)
-                self.btn_treinar.config(state=tk.NORMAL, text=" TREINAR SISTEMA")
-                self.log(" Falha ao treinar modelo!", self.COR_ERRO)
-                messagebox.showerror("Erro", "Falha ao treinar modelo!")
+    def _falha_treinamento(self, status, mensagem):
+        self._finalizar_treinamento(status, self.COR_ERRO)
+        self.log(f" {mensagem}", self.COR_ERRO)
+        messagebox.showerror("Erro", mensagem)
 
-        except Exception as e:
-            self.log(f" Erro no treinamento: {e}", self.COR_ERRO)
-            self.label_status_treinamento.config(text=" Erro no treinamento", fg=self.COR_ERRO)
-            self.btn_treinar.config(state=tk.NORMAL, text=" TREINAR SISTEMA")
-            messagebox.showerror("Erro", f"Erro no treinamento: {str(e)}")
+    def _cancelamento_concluido(self):
+        self._finalizar_treinamento(" Treinamento cancelado", self.COR_ALERTA)
+        self.log(" Treinamento cancelado; o modelo anterior foi mantido", self.COR_ALERTA)
 
     def limpar_dados(self):
 
@@ -1651,11 +4508,17 @@ class SistemaReconhecimento:
                                    "Tem certeza que deseja continuar?"):
             return
 
+        if self.tarefa_treinamento is not None and self.tarefa_treinamento.ativa():
+            messagebox.showwarning("Aviso", "Aguarde o fim do treinamento ou cancele-o antes de limpar os dados.")
+            return
+
         try:
 
             if self.sistema_ativo:
                 self.parar_sistema()
 
+            # Libera o model_data.bin mapeado em memória antes de apagá-lo
+            self.recognizer = None
 
             dataset_dir = "dataset"
             if os.path.exists(dataset_dir):
@@ -1673,8 +4536,8 @@ class SistemaReconhecimento:
             # Limpar variáveis
             self.nomes = {}
             self.recognizer = None
+            self.marcar_prontidao('modelo', 'não treinado')
             self.estatisticas = {'reconhecimentos': 0, 'desconhecidos': 0, 'alertas': 0}
-            self.ultimo_alarme = {}
 
             # Atualizar interface
             self.atualizar_lista()
@@ -1732,8 +4595,8 @@ class SistemaReconhecimento:
                 self.salvar_nomes()
                 self.atualizar_lista()
 
-                # Resetar modelo
-                self.recognizer = None
+                # O modelo atual continua em uso; o ID removido já não está em
+                # self.nomes e passa a ser exibido como desconhecido até o retreino
                 self.log(f" Pessoa ID {user_id} removida!", self.COR_SUCESSO)
                 messagebox.showinfo("Sucesso", f"Pessoa ID {user_id} removida com sucesso!")
 
@@ -1761,7 +4624,8 @@ class SistemaReconhecimento:
 
     def iniciar_sistema(self):
 
-        if not self.camera_atual:
+        cameras = self.cameras_selecionadas()
+        if not cameras:
             messagebox.showwarning("Aviso", "Selecione uma câmera!")
             return
 
@@ -1769,6 +4633,9 @@ class SistemaReconhecimento:
             messagebox.showwarning("Aviso", "Treine o modelo primeiro!")
             return
 
+        if self.editando_zonas:
+            self.concluir_zonas()
+
         self.sistema_ativo = True
         self.label_status.config(text=" ONLINE", fg=self.COR_SUCESSO)
         self.log(f" Sistema iniciado", self.COR_SUCESSO)
@@ -1777,144 +4644,399 @@ class SistemaReconhecimento:
         self.btn_parar.config(state=tk.NORMAL)
         self.btn_cadastrar.config(state=tk.DISABLED)
 
-        self.thread_camera = threading.Thread(target=self.processar_camera, daemon=True)
+        self.caixa_video = CaixaQuadro()
+        self.previa_visivel = True
+        self.thread_camera = threading.Thread(target=self.processar_camera, args=(cameras,), daemon=True)
         self.thread_camera.start()
+        self.root.after(self.intervalo_previa_ms, self.exibir_previa)
+
+    def cameras_selecionadas(self):
+        """Câmeras marcadas em 'Monitorar'; sem marcação, a câmera escolhida na lista"""
+        marcadas = [cam for cam in self.cameras_disponiveis
+                    if cam['index'] in self.cameras_monitoradas and self.cameras_monitoradas[cam['index']].get()]
+        return marcadas or ([self.camera_atual] if self.camera_atual else [])
+
+    def processar_camera(self, cameras):
+        """Monitora as câmeras com captura e detecção próprias e reconhecimento compartilhado"""
+        monitores = []
+        for camera in cameras:
+            monitor = MonitorCamera(camera, reverificar_a_cada=self.rastreio_reverificar,
+                                    cadencia_maxima=self.cadencia_maxima,
+                                    portao_movimento=self.portao_movimento)
+            if monitor.captura.iniciar():
+                monitores.append(monitor)
+            else:
+                self.log_da_thread(f" Não foi possível abrir {camera['name']}", self.COR_ERRO)
 
-    def processar_camera(self):
-
-        self.cam = cv2.VideoCapture(self.camera_atual['index'])
-        self.cam.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
-        if not self.cam.isOpened():
+        if not monitores:
             messagebox.showerror("Erro", "Não foi possível abrir a câmera!")
             self.parar_sistema()
             return
 
-        self.log(" Processando câmera...", self.COR_INFO)
-
+        self.monitores = monitores
+        self.mosaico = {}
+        self.controle_taxa = ControladorTaxa(fps_alvo=self.fps_alvo, orcamento_cpu=self.orcamento_cpu)
+        self.log_da_thread(f" Processando {len(monitores)} câmera(s)...", self.COR_INFO)
+
+        # Por câmera: captura -> detecção. Compartilhados: reconhecimento (pool com rodízio
+        # entre câmeras) -> anotação -> render, e alertas à parte. A detecção do quadro N+1
+        # roda enquanto o quadro N é reconhecido
+        def fila(nome, classe=FilaLimitada):
+            return classe(self.config_pipeline[nome]['capacidade'], self.config_pipeline[nome]['politica'])
+
+        def estagio(nome, funcao, entrada, saida, config=None):
+            return EstagioPipeline(nome, funcao, entrada, saida,
+                                   trabalhadores=self.config_pipeline[config or nome]['trabalhadores'],
+                                   ao_erro=lambda nome, e: self.log_da_thread(f" Erro no estágio {nome}: {e}",
+                                                                             self.COR_ERRO))
+
+        reconhecimento, anotacao, render = fila('reconhecimento', FilaJusta), fila('anotacao'), fila('render')
+        self.fila_alertas = fila('alertas')
+        deteccao = {monitor.indice: estagio(f"deteccao_{monitor.indice}", self._estagio_deteccao,
+                                            fila('deteccao'), reconhecimento, config='deteccao')
+                    for monitor in monitores}
+        self.estagios = list(deteccao.values()) + [
+            estagio('reconhecimento', self._estagio_reconhecimento, reconhecimento, anotacao),
+            estagio('anotacao', self._estagio_anotacao, anotacao, render),
+            estagio('render', self._estagio_render, render, None),
+            estagio('alertas', self.disparar_alerta, self.fila_alertas, None),
+        ]
+        for item in self.estagios:
+            item.iniciar()
+
+        for monitor in monitores:
+            monitor.thread = threading.Thread(target=self._alimentar_camera,
+                                              args=(monitor, deteccao[monitor.indice].entrada), daemon=True)
+            monitor.thread.start()
+        for monitor in monitores:
+            monitor.thread.join()
+
+        for item in self.estagios:
+            item.parar()
+        for monitor in monitores:
+            monitor.captura.parar()
+
+    def _alimentar_camera(self, monitor, fila):
+        """Estágio de captura de uma câmera: repassa sempre o quadro mais recente"""
+        numero = 0
         while self.sistema_ativo:
-            ret, frame = self.cam.read()
-            if not ret:
-                break
-
-            frame = self.detectar_faces(frame)
-            self.atualizar_video(frame)
-            time.sleep(0.03)
-
-        if self.cam:
-            self.cam.release()
-
-    def detectar_faces(self, frame):
-
-        try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-            if self.face_cascade is None:
-                self.face_cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
-
-            faces = self.face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=5,
-                minSize=(80, 80)
-            )
-
-            for (x, y, w, h) in faces:
-                face_roi = gray[y:y + h, x:x + w]
-                face_resized = cv2.resize(face_roi, (200, 200))
-                face_resized = cv2.equalizeHist(face_resized)
-
-                try:
-                    user_id, confidence = self.recognizer.predict(face_resized)
-
-                    if user_id != -1 and user_id in self.nomes and confidence <= self.confidence_threshold:
-
-                        pessoa = self.nomes[user_id]
-                        self.estatisticas['reconhecimentos'] += 1
-
-                        if pessoa['tipo'] == "CRIMINOSO":
-
-                            cor = (0, 0, 255)  # Vermelho
-                            texto = f"CRIMINOSO: {pessoa['nome']}"
-
-                            # Verificar cooldown (alarme a cada 10 segundos por pessoa)
-                            current_time = time.time()
-                            cooldown = 10  # segundos
-
-                            if user_id not in self.ultimo_alarme or \
-                                    current_time - self.ultimo_alarme[user_id] > cooldown:
-
+            self.controle_taxa.aguardar(monitor.indice)
+            frame = monitor.captura.ler()
+            if frame is None:
+                if not monitor.captura.ativa:
+                    self.log_da_thread(f" {monitor.nome} parou de enviar quadros", self.COR_ALERTA)
+                    break
+                continue
+
+            numero += 1
+            fila.colocar({'camera': monitor, 'numero': numero, 'frame': frame, 'inicio': time.perf_counter()})
+
+    def _estagio_deteccao(self, quadro):
+        monitor = quadro['camera']
+        rastreador = monitor.rastreador
+        gray = cv2.cvtColor(quadro['frame'], cv2.COLOR_BGR2GRAY)
+
+        # Regiões onde a detecção completa roda: as zonas da câmera agrupadas em retângulos
+        # sem sobreposição (None = quadro inteiro), restritas ao trecho com movimento
+        altura, largura = gray.shape[:2]
+        zonas = zonas_em_pixels(monitor.zonas, largura, altura) if monitor.zonas else None
+        regioes = agrupar_zonas(zonas) if zonas else None
+        if monitor.movimento is not None:
+            movimento = monitor.movimento.analisar(gray, zonas)
+            if movimento is not None:
+                regioes = [movimento] if regioes is None else \
+                    [regiao for regiao in (intersecao(zona, movimento) for zona in regioes) if regiao]
+            if movimento is None or not regioes:
+                # Cena parada: as trilhas continuam onde estavam e nada é detectado ou reconhecido
+                quadro['trilhas'] = rastreador.trilhas_recentes()
+                quadro['reconhecer'], quadro['recortes'] = [], []
+                return quadro
+
+        # Detecção completa quando a cadência manda ou quando a busca local perde uma trilha
+        faces = None
+        if not monitor.cadencia.deve_detectar(quadro['numero']):
+            faces = self.seguir_faces(gray, rastreador.trilhas_recentes(), monitor.cadencia)
+        if faces is None:
+            inicio = time.perf_counter()
+            faces = self.localizar_faces(gray, regioes)
+            monitor.cadencia.registrar_completa(quadro['numero'], (time.perf_counter() - inicio) * 1000,
+                                                1000.0 / self.controle_taxa.fps_atual(), len(faces))
+        if zonas:
+            # O retângulo de um grupo pode achar faces fora das zonas que o formam, e a busca
+            # local pode levar uma trilha para fora dela: vale o centro da face
+            faces = [caixa for caixa in faces if dentro_das_zonas(caixa, zonas)]
+
+        # Só trilhas novas ou com reverificação vencida seguem para o reconhecimento; sob
+        # carga o controlador de ritmo pula o reconhecimento em parte dos quadros
+        quadro['trilhas'] = rastreador.atualizar(faces, quadro['numero'])
+        quadro['reconhecer'] = []
+        if self.controle_taxa.deve_reconhecer(quadro['numero']):
+            quadro['reconhecer'] = [trilha for trilha in quadro['trilhas']
+                                    if rastreador.precisa_reconhecer(trilha, quadro['numero'])]
+        quadro['recortes'] = [self.recortar_face(gray, trilha.caixa) for trilha in quadro['reconhecer']]
+        return quadro
+
+    def _estagio_reconhecimento(self, quadro):
+        quadro['predicoes'] = self.reconhecer_recortes(quadro['recortes']) if quadro['recortes'] else []
+        return quadro
+
+    def _estagio_anotacao(self, quadro):
+        monitor = quadro['camera']
+        for trilha, predicao in zip(quadro['reconhecer'], quadro['predicoes']):
+            if predicao is None:
+                continue
+            user_id, confidence = predicao
+            if user_id == -1 or user_id not in self.nomes or confidence > self.confidence_threshold:
+                user_id = -1
+            monitor.rastreador.registrar(trilha, user_id, confidence)
+
+        for alerta in self.anotar_trilhas(quadro['frame'], quadro['trilhas'], monitor):
+            self.fila_alertas.colocar(alerta)
+        return quadro
+
+    def _estagio_render(self, quadro):
+        monitor = quadro['camera']
+        self.controle_taxa.concluir()
+        # Com vários workers por estágio um quadro pode chegar atrasado; nunca volta no tempo
+        if quadro['numero'] <= monitor.ultimo_renderizado:
+            return None
+        monitor.ultimo_renderizado = quadro['numero']
+        monitor.fps_processamento.registrar()
+        # Janela minimizada: ninguém vê a prévia, então nem monta o mosaico
+        if self.previa_visivel:
+            self.desenhar_contadores(quadro['frame'], monitor)
+            self.mosaico[monitor.indice] = quadro['frame']
+            self.caixa_video.depositar(self.montar_mosaico())
+        return None
+
+    def montar_mosaico(self):
+        """Último quadro de cada câmera em uma grade (com uma câmera, o próprio quadro)"""
+        quadros = [self.mosaico[indice] for indice in sorted(self.mosaico)]
+        if len(quadros) == 1:
+            frame = quadros[0]
+        else:
+            colunas = int(np.ceil(np.sqrt(len(quadros))))
+            linhas = int(np.ceil(len(quadros) / colunas))
+            largura, altura = 640 // colunas, 480 // linhas
+            frame = np.zeros((altura * linhas, largura * colunas, 3), dtype=np.uint8)
+            for posicao, quadro in enumerate(quadros):
+                linha, coluna = divmod(posicao, colunas)
+                frame[linha * altura:(linha + 1) * altura, coluna * largura:(coluna + 1) * largura] = \
+                    cv2.resize(quadro, (largura, altura))
+
+        estagios = " ".join(f"{nome[:3]}{''.join(c for c in nome if c.isdigit())}:"
+                            f"{dados['latencia_ms']:.0f}ms/q{dados['fila']}"
+                            for nome, dados in self.estatisticas_pipeline().items())
+        cv2.putText(frame, estagios, (10, frame.shape[0] - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+        return frame
 
-                                self.ultimo_alarme[user_id] = current_time
-                                self.estatisticas['alertas'] += 1
+    def estatisticas_pipeline(self):
+        """Profundidade de fila, latência e descartes de cada estágio"""
+        return {estagio.nome: estagio.estatisticas() for estagio in self.estagios}
+
+    def desenhar_contadores(self, frame, monitor):
+        """Sobrepõe câmera, FPS de captura/processamento, quadros descartados e economia da detecção"""
+        estatisticas = monitor.captura.estatisticas()
+        texto = (f"{monitor.nome} | Captura: {estatisticas['fps_captura']:.1f} fps | "
+                 f"Proc.: {monitor.fps_processamento.fps():.1f} fps | "
+                 f"Descartados: {estatisticas['descartados']}")
+        cv2.putText(frame, texto, (10, frame.shape[0] - 50),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+        ritmo = self.controle_taxa.estado()
+        texto = (f"Ritmo: {ritmo['fps_obtido']:.1f}/{ritmo['fps_alvo']:.0f} fps | "
+                 f"Rec.: 1/{ritmo['passo_reconhecimento']} | Det. completa: 1/{monitor.cadencia.intervalo}")
+        if monitor.movimento is not None:
+            texto += f" | Cena parada: {monitor.movimento.taxa_acerto() * 100:.0f}% dos quadros"
+        cv2.putText(frame, texto, (10, frame.shape[0] - 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+    def cascade_da_thread(self):
+        """Classificador da thread atual (cada worker de detecção usa o seu)"""
+        face_cascade = getattr(self.detectores_thread, 'cascade', None)
+        if face_cascade is None:
+            face_cascade = self.detectores_thread.cascade = \
+                cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
+        return face_cascade
+
+    def localizar_faces(self, gray, regioes=None):
+        """Detecta as faces no quadro ou só nas regiões (x, y, w, h) indicadas; caixas em resolução total"""
+        if regioes is None:
+            regioes = [(0, 0, gray.shape[1], gray.shape[0])]
+
+        # Faixas mais estreitas que a menor face (sobras de zonas ou do recorte por movimento) ficam de fora
+        min_lado = 80
+        regioes = [regiao for regiao in regioes if min(regiao[2], regiao[3]) >= min_lado]
+        face_cascade = self.cascade_da_thread()
+        faces = []
+        for x, y, w, h in regioes:
+            # Detecta em resolução reduzida; os recortes saem do quadro em resolução total
+            encontradas = detectar_faces_escala(face_cascade, gray[y:y + h, x:x + w], self.escala_deteccao,
+                                                min_lado=min_lado, scaleFactor=1.1, minNeighbors=5)
+            faces.extend((int(fx) + x, int(fy) + y, int(fw), int(fh)) for fx, fy, fw, fh in encontradas)
+        return faces
+
+    def seguir_faces(self, gray, trilhas, cadencia):
+        """Atualiza as caixas das trilhas por busca local; None se alguma se perdeu"""
+        inicio = time.perf_counter()
+        face_cascade = self.cascade_da_thread()
+        caixas = []
+        for trilha in trilhas:
+            caixa = buscar_face_local(face_cascade, gray, trilha.caixa, escala=self.escala_deteccao)
+            if caixa is None:
+                return None
+            caixas.append(caixa)
+        cadencia.registrar_local((time.perf_counter() - inicio) * 1000, len(trilhas))
+        return caixas
+
+    def recortar_face(self, gray, caixa):
+        """Recorte 200x200 equalizado da face, usado pelo reconhecimento"""
+        x, y, w, h = caixa
+        face_roi = gray[y:y + h, x:x + w]
+        face_resized = cv2.resize(face_roi, (200, 200))
+        return cv2.equalizeHist(face_resized)
+
+    def reconhecer_recortes(self, recortes):
+        """Reconhece todas as faces do quadro em uma única passada"""
+        # Usa a geração do modelo vigente no início da chamada
+        with self.modelos.adquirir() as recognizer:
+            try:
+                return recognizer.predict_batch(recortes)
+            except Exception:
+                return [None] * len(recortes)
+
+    def anotar_trilhas(self, frame, trilhas, monitor):
+        """Desenha caixas e rótulos das trilhas e retorna os alertas de criminosos a disparar
+
+        Cada trilha conta uma única vez nas estatísticas (por câmera e no total)
+        e gera no máximo um alerta, com a identidade mais votada.
+        """
+        alertas = []
+        contadores = (self.estatisticas, monitor.estatisticas)
+        for trilha in trilhas:
+            x, y, w, h = trilha.caixa
+            try:
+                identidade = trilha.identidade()
+                if identidade is None:
+                    # Reconhecimento ainda em andamento
+                    cv2.rectangle(frame, (x, y), (x + w, y + h), (200, 200, 200), 1)
+                    continue
+                user_id, confidence = identidade
+                primeira_vez = not trilha.contada
+                trilha.contada = True
+
+                if user_id != -1 and user_id in self.nomes:
+
+                    pessoa = self.nomes[user_id]
+                    if primeira_vez:
+                        for estatisticas in contadores:
+                            estatisticas['reconhecimentos'] += 1
+
+                    if pessoa['tipo'] == "CRIMINOSO":
+
+                        cor = (0, 0, 255)  # Vermelho
+                        texto = f"#{trilha.id} CRIMINOSO: {pessoa['nome']}"
+
+                        # Um alerta por trilha; o cooldown por pessoa cobre trilhas que se partem
+                        current_time = time.time()
+                        cooldown = 10  # segundos
+
+                        if not trilha.alertada:
+                            trilha.alertada = True
+                            if user_id not in monitor.ultimo_alarme or \
+                                    current_time - monitor.ultimo_alarme[user_id] > cooldown:
+
+                                monitor.ultimo_alarme[user_id] = current_time
+                                for estatisticas in contadores:
+                                    estatisticas['alertas'] += 1
+                                alertas.append({'user_id': user_id, 'pessoa': pessoa, 'confidence': confidence,
+                                                'horario': datetime.now(), 'camera': monitor.nome,
+                                                'trilha': trilha.id})
+
+                        if int(current_time * 2) % 2 == 0:
+                            cv2.rectangle(frame, (0, 0),
+                                          (frame.shape[1], frame.shape[0]),
+                                          (0, 0, 255), 15)
+                    else:
 
-                                # LOG DE ALERTA
-                                self.log("=" * 50, self.COR_ERRO)
-                                self.log(" ALERTA MÁXIMO! ", self.COR_ERRO)
-                                self.log(f"CRIMINOSO DETECTADO: {pessoa['nome']}", self.COR_ERRO)
-                                self.log(f"Confiança: {confidence:.1f}% | ID: {user_id}", self.COR_ERRO)
-                                self.log(f"Horário: {datetime.now().strftime('%H:%M:%S')}", self.COR_ERRO)
-                                self.log("=" * 50, self.COR_ERRO)
+                        cor = (0, 255, 0)  # Verde
+                        texto = f"#{trilha.id} CIVIL: {pessoa['nome']}"
+                else:
 
-                                if self.alarme_habilitado:
-                                    self.log(" ATIVANDO SIRENE POLICIAL...", self.COR_ALERTA)
-                                    self.sistema_alarme.iniciar_alarme(duracao=5)
+                    if primeira_vez:
+                        for estatisticas in contadores:
+                            estatisticas['desconhecidos'] += 1
+                    cor = (128, 128, 128)  # Cinza
+                    texto = f"#{trilha.id} DESCONHECIDO"
 
 
-                                with open("alertas_criminosos.log", "a") as f:
-                                    f.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | "
-                                            f"ID:{user_id} | {pessoa['nome']} | "
-                                            f"Conf:{confidence:.1f}%\n")
+                cv2.rectangle(frame, (x, y), (x + w, y + h), cor, 2)
 
 
-                            if int(current_time * 2) % 2 == 0:
-                                cv2.rectangle(frame, (0, 0),
-                                              (frame.shape[1], frame.shape[0]),
-                                              (0, 0, 255), 15)
-                        else:
+                cv2.rectangle(frame, (x, y - 30), (x + w, y), cor, -1)
 
-                            cor = (0, 255, 0)  # Verde
-                            texto = f"CIVIL: {pessoa['nome']}"
-                    else:
+                # Texto
+                cv2.putText(frame, texto, (x + 5, y - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
 
-                        self.estatisticas['desconhecidos'] += 1
-                        cor = (128, 128, 128)  # Cinza
-                        texto = "DESCONHECIDO"
 
+                cv2.putText(frame, f"Conf: {confidence:.1f}",
+                            (x + 5, y + h + 20),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, cor, 1)
 
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), cor, 2)
+            except Exception as e:
+                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
 
+        return alertas
 
-                    cv2.rectangle(frame, (x, y - 30), (x + w, y), cor, -1)
+    def disparar_alerta(self, alerta):
+        """Log, sirene e registro em arquivo de um alerta (estágio de alertas)"""
+        pessoa = alerta['pessoa']
 
-                    # Texto
-                    cv2.putText(frame, texto, (x + 5, y - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        # LOG DE ALERTA
+        self.log_da_thread("=" * 50, self.COR_ERRO)
+        self.log_da_thread(" ALERTA MÁXIMO! ", self.COR_ERRO)
+        self.log_da_thread(f"CRIMINOSO DETECTADO: {pessoa['nome']}", self.COR_ERRO)
+        self.log_da_thread(f"Confiança: {alerta['confidence']:.1f}% | ID: {alerta['user_id']}", self.COR_ERRO)
+        self.log_da_thread(f"Câmera: {alerta['camera']} | Trilha #{alerta['trilha']}", self.COR_ERRO)
+        self.log_da_thread(f"Horário: {alerta['horario'].strftime('%H:%M:%S')}", self.COR_ERRO)
+        self.log_da_thread("=" * 50, self.COR_ERRO)
 
+        if self.alarme_habilitado:
+            self.log_da_thread(" ATIVANDO SIRENE POLICIAL...", self.COR_ALERTA)
+            self.sistema_alarme.iniciar_alarme(duracao=5)
 
-                    cv2.putText(frame, f"Conf: {confidence:.1f}",
-                                (x + 5, y + h + 20),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, cor, 1)
 
-                except Exception as e:
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
+        with open("alertas_criminosos.log", "a") as f:
+            f.write(f"{alerta['horario'].strftime('%Y-%m-%d %H:%M:%S')} | "
+                    f"ID:{alerta['user_id']} | {pessoa['nome']} | "
+                    f"Conf:{alerta['confidence']:.1f}% | {alerta['camera']}\n")
 
-        except Exception as e:
-            self.log(f" Erro na detecção: {e}", self.COR_ERRO)
+    def exibir_previa(self):
+        """Busca o quadro mais recente do pipeline e o mostra (thread da interface, via root.after)"""
+        if not self.sistema_ativo:
+            return
 
-        return frame
+        self.previa_visivel = self.root.state() != 'iconic'
+        frame = self.caixa_video.retirar()
+        if frame is not None and self.previa_visivel:
+            self.atualizar_video(frame)
+        self.root.after(self.intervalo_previa_ms, self.exibir_previa)
 
     def atualizar_video(self, frame):
-
+        """Cola o quadro na PhotoImage da prévia, criada uma única vez (só na thread da interface)"""
         try:
-            frame_resized = cv2.resize(frame, (640, 480))
-            frame_rgb = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame_rgb)
-            imgtk = ImageTk.PhotoImage(image=img)
-
-            self.label_video.imgtk = imgtk
-            self.label_video.configure(image=imgtk)
+            altura, largura = self._rgb_video.shape[:2]
+            if frame.shape[:2] != (altura, largura):
+                frame = cv2.resize(frame, (largura, altura))
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._rgb_video)
+
+            if self.foto_video is None:
+                self.foto_video = ImageTk.PhotoImage('RGB', (largura, altura))
+            self.foto_video.paste(Image.fromarray(self._rgb_video))
+            if self.label_video.cget('image') != str(self.foto_video):
+                self.label_video.configure(image=self.foto_video, text="")
         except:
             pass
 
@@ -1935,13 +5057,43 @@ class SistemaReconhecimento:
                          f"{self.estatisticas['alertas']} alertas",
                          self.COR_INFO)
 
-        self.btn_iniciar.config(state=tk.NORMAL)
+        if self.recognizer is not None and self.recognizer.recall_medido() is not None:
+            self.log(f" Recall do índice de busca: {self.recognizer.recall_medido() * 100:.1f}% "
+                     f"({self.recognizer.recall_verificacoes} consultas conferidas)", self.COR_INFO)
+
+        self.btn_iniciar.config(state=tk.NORMAL if self.sistema_pronto() else tk.DISABLED)
         self.btn_parar.config(state=tk.DISABLED)
-        self.btn_cadastrar.config(state=tk.NORMAL)
+        self.btn_cadastrar.config(state=tk.NORMAL if self.face_cascade is not None else tk.DISABLED)
+
+        for nome, dados in self.estatisticas_pipeline().items():
+            self.log(f" Estágio {nome}: {dados['processados']} processados, {dados['latencia_ms']:.1f} ms, "
+                     f"{dados['descartados']} descartados, {dados['erros']} erros", self.COR_INFO)
+
+        if self.controle_taxa is not None:
+            ritmo = self.controle_taxa.estado()
+            self.log(f" Ritmo: {ritmo['fps_obtido']:.1f} fps obtidos (alvo {ritmo['fps_alvo']:.0f}), "
+                     f"reconhecimento em 1/{ritmo['passo_reconhecimento']} dos quadros, "
+                     f"CPU {ritmo['uso_cpu'] * 100:.0f}%", self.COR_INFO)
+
+        for monitor in self.monitores:
+            estatisticas = monitor.captura.estatisticas()
+            self.log(f" {monitor.nome}: {monitor.estatisticas['reconhecimentos']} reconhecidos, "
+                     f"{monitor.estatisticas['desconhecidos']} desconhecidos, "
+                     f"{monitor.estatisticas['alertas']} alertas | {estatisticas['capturados']} quadros, "
+                     f"{estatisticas['descartados']} descartados por estarem desatualizados | detecção completa em "
+                     f"{monitor.cadencia.proporcao_completas() * 100:.0f}% dos quadros", self.COR_INFO)
+            if monitor.movimento is not None and monitor.movimento.ignorados:
+                # Estimativa pelo custo médio medido da detecção completa
+                economia = monitor.movimento.ignorados * (monitor.cadencia.custo_completa_ms or 0.0) / 1000
+                self.log(f" {monitor.nome}: cena parada em {monitor.movimento.taxa_acerto() * 100:.0f}% dos "
+                         f"quadros ({monitor.movimento.ignorados}), ~{economia:.1f} s de detecção evitados",
+                         self.COR_INFO)
+            monitor.captura.parar()
+        self.monitores = []
 
-        if self.cam:
-            self.cam.release()
-            self.cam = None
+        if self.caixa_video.depositados:
+            self.log(f" Prévia: {self.caixa_video.depositados - self.caixa_video.agrupados} de "
+                     f"{self.caixa_video.depositados} quadros exibidos (os demais foram agrupados)", self.COR_INFO)
 
         self.label_video.config(text=" CÂMERA DESCONECTADA", image="")
 
@@ -1960,6 +5112,8 @@ class SistemaReconhecimento:
 
     def fechar(self):
 
+        if self.tarefa_treinamento is not None:
+            self.tarefa_treinamento.cancelar()
         self.parar_sistema()
         self.sistema_alarme.parar_alarme()
         time.sleep(0.5)